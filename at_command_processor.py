@@ -1,14 +1,16 @@
 #
 # File: at_command_processor.py
-# Revision: 1 (New)
-# Description:
-# This module handles the parsing and processing of `@<path>` commands,
-# allowing file and directory content to be injected directly into the prompt context.
+# Revision: 4
+# Description: @-paths are only recognised at the start of a word.
 #
 
+import os
+import re
+import asyncio
 import logging
+from collections import OrderedDict
 from pathlib import Path
-from typing import List, Dict, Union, Literal
+from typing import List, Dict, Union, Literal, Tuple
 
 from config import Config
 from services.file_discovery_service import FileDiscoveryService
@@ -19,6 +21,46 @@ AtCommandPart = Dict[Literal["type", "content"], str]
 PromptPart = Dict[Literal["text"], str]
 ProcessedPrompt = List[PromptPart]
 
+# A single character class with one quantifier: matched in linear time.
+# The lookbehind only accepts an @ at the start of a word, so e-mail
+# addresses are not read as paths.
+_AT_PATH_RE = re.compile(r'(?<!\S)@(\S+)')
+
+_FILE_CACHE_SIZE = 32
+# (path, mtime_ns, size) -> file content, least recently used first.
+_file_cache: "OrderedDict[Tuple[str, int, int], str]" = OrderedDict()
+
+async def _read_at_path(read_file_tool, root_dir: Path, path_str: str) -> str:
+    """Returns the prompt text for one @-path, reusing cached content if the file is unchanged."""
+    try:
+        stat = await asyncio.to_thread(os.stat, root_dir / path_str)
+        cache_key = (str(root_dir / path_str), stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        cache_key = None
+    if cache_key in _file_cache:
+        _file_cache.move_to_end(cache_key)
+        return f"\n\n--- Content from @{path_str} ---\n{_file_cache[cache_key]}"
+
+    logging.debug(f"Reading content for @{path_str}")
+    try:
+        # Use the read_file tool's logic to read the file
+        result = await read_file_tool.execute(path=path_str)
+        if "error" in result:
+            content = f"Error reading {path_str}: {result['error']}"
+        else:
+            content = result.get("content", f"Error: No content found for {path_str}")
+            if cache_key is not None and "content" in result:
+                _file_cache[cache_key] = content
+                if len(_file_cache) > _FILE_CACHE_SIZE:
+                    _file_cache.popitem(last=False)
+
+        # Add the file content as a separate, clearly marked part
+        return f"\n\n--- Content from @{path_str} ---\n{content}"
+
+    except Exception as e:
+        logging.error(f"Failed to process @{path_str}: {e}")
+        return f"\n\n--- Error reading @{path_str}: {e} ---"
+
 async def handle_at_command(
     prompt: str, config: Config, tool_registry: ToolRegistry
 ) -> ProcessedPrompt:
@@ -34,7 +76,7 @@ async def handle_at_command(
     # This is a simplified parser. A more robust one would handle escaped @'s.
     parts: List[AtCommandPart] = []
     current_index = 0
-    for match in re.finditer(r'@(\S+)', prompt):
+    for match in _AT_PATH_RE.finditer(prompt):
         start, end = match.span()
         # Add text before the @-command
         if start > current_index:
@@ -56,28 +98,18 @@ async def handle_at_command(
         logging.error("read_file tool not found, cannot process @-commands.")
         return [{"text": prompt}]
 
+    at_paths = []
     for part in parts:
         if part["type"] == "text":
             initial_text_parts.append(part["content"])
         elif part["type"] == "at_path":
             path_str = part["content"]
             initial_text_parts.append(f"@{path_str}") # Add the original reference to the main prompt
-            
-            logging.debug(f"Reading content for @{path_str}")
-            try:
-                # Use the read_file tool's logic to read the file
-                result = await read_file_tool.execute(path=path_str)
-                if "error" in result:
-                    content = f"Error reading {path_str}: {result['error']}"
-                else:
-                    content = result.get("content", f"Error: No content found for {path_str}")
-                
-                # Add the file content as a separate, clearly marked part
-                processed_parts.append({"text": f"\n\n--- Content from @{path_str} ---\n{content}"})
-
-            except Exception as e:
-                logging.error(f"Failed to process @{path_str}: {e}")
-                processed_parts.append({"text": f"\n\n--- Error reading @{path_str}: {e} ---"})
+            at_paths.append(path_str)
+
+    root_dir = config.get_target_dir()
+    file_texts = await asyncio.gather(*(_read_at_path(read_file_tool, root_dir, p) for p in at_paths))
+    processed_parts.extend({"text": text} for text in file_texts)
 
     final_prompt = "".join(initial_text_parts)
     return [{"text": final_prompt}] + processed_parts
\ No newline at end of file
@@ -1,23 +1,27 @@
 #
 # File: chat_session.py
-# Revision: 2
-# Description: Fixes the construction of the request_components dictionary
-# to no longer include the 'model' key, as this is now handled dynamically
-# inside GeminiClient._make_api_request to enable model fallback on retry.
+# Revision: 22
+# Description: History compression runs in a background task started after a
+# turn completes, and its result is swapped in at the start of a later turn,
+# so no turn waits on the summary request.
 #
 
 import json
 import logging
 import asyncio
-from typing import AsyncGenerator, Dict, Any, List, Union, TYPE_CHECKING
+import functools
+from pathlib import Path
+from typing import AsyncGenerator, Awaitable, Dict, Any, List, Union, TYPE_CHECKING
 
 from config import Config
-from tool_registry import ToolRegistry
 from core_tool_scheduler import CoreToolScheduler
 from tools.tool_io import ToolConfirmationOutcome
 from prompts import get_core_system_prompt
-from services.memory_discovery import load_memory
+from services.memory_discovery import find_memory_files, get_memory_signature, load_memory
 from utils.next_speaker_checker import check_next_speaker, NextSpeaker
+from utils.history_compressor import summarize_history
+from utils.request_encoding import ContentsEncoder, loads_json
+from utils.sse import iter_sse_data, SSE_READ_CHUNK_SIZE
 
 if TYPE_CHECKING:
     from gemini_client import GeminiClient
@@ -25,6 +29,33 @@ if TYPE_CHECKING:
 # The prompt can be a simple string or a list of content parts from the @-processor
 PromptType = Union[str, List[Dict[str, str]]]
 
+# Shared by every session. History messages are never mutated after creation.
+CONTEXT_ACK_MESSAGE: Dict[str, Any] = {"role": "model", "parts": [{"text": "Understood. I will follow these instructions and use my tools to assist you."}]}
+SUMMARY_ACK_MESSAGE: Dict[str, Any] = {"role": "model", "parts": [{"text": "Understood. I will continue from this summary."}]}
+SUMMARY_HEADER = "# Summary of the earlier conversation\n"
+
+# The context message and its acknowledgement, which are never compressed.
+CONTEXT_PREFIX_LEN = 2
+# Once the history exceeds COMPRESS_THRESHOLD messages, everything before the
+# last CHAT_WINDOW messages is replaced by a summary.
+COMPRESS_THRESHOLD = 200
+CHAT_WINDOW = 50
+
+def _is_user_prompt(message: Dict[str, Any]) -> bool:
+    return message.get("role") == "user" and not any("functionResponse" in p for p in message.get("parts", []))
+
+@functools.lru_cache(maxsize=8)
+def _build_context_message(target_dir: Path, memory_signature: tuple) -> Dict[str, Any]:
+    """Builds the system context message. Cached until the memory files change."""
+    core_prompt = get_core_system_prompt(target_dir)
+    memory_content = load_memory(target_dir, [Path(p) for p, _ in memory_signature])
+    full_prompt_text = core_prompt
+    if memory_content:
+        full_prompt_text += "\n\n# User-Provided Context\n"
+        full_prompt_text += "You MUST use the following context to augment your knowledge and follow any directives given.\n"
+        full_prompt_text += memory_content
+    return {"role": "user", "parts": [{"text": full_prompt_text}]}
+
 class ChatSession:
     """
     Manages a single, stateful conversation with the Gemini model.
@@ -34,101 +65,205 @@ class ChatSession:
         self.config = config
         self.model = model
         self.history: List[Dict[str, Any]] = []
-        self.tool_registry = ToolRegistry(self.config)
+        self.tool_registry = self.config.get_tool_registry()
         self._scheduler = CoreToolScheduler(self.tool_registry)
+        self._contents_encoder = ContentsEncoder()
+        # The most recent functionResponse message appended by send_message_stream.
+        self._last_tool_response: Dict[str, Any] | None = None
+        # Tool declarations are static for the lifetime of the session.
+        self._tools_payload = self.tool_registry.get_declarations()
 
         # State for handling user confirmations for tool calls
         self._pending_confirmation: Dict[str, Any] | None = None
         self._confirmation_received_event = asyncio.Event()
         self._confirmation_outcome: ToolConfirmationOutcome | None = None
-        
+
+        # History length at the last failed compression; retried only after CHAT_WINDOW more messages.
+        self._compress_failed_at: int | None = None
+        # Summarises the old history between turns; see _start_background_compression.
+        self._compression_task: asyncio.Task | None = None
+
+        # Serialises the Pro -> Flash switch when several requests hit 429s at once.
+        self._fallback_lock = asyncio.Lock()
+
         self._initialize_chat_context()
 
     def _initialize_chat_context(self):
         logging.debug("Initializing chat context...")
         target_dir = self.config.get_target_dir()
-        core_prompt = get_core_system_prompt(target_dir)
-        memory_content = load_memory(target_dir)
-        full_prompt_text = core_prompt
-        if memory_content:
-            full_prompt_text += "\n\n# User-Provided Context\n"
-            full_prompt_text += "You MUST use the following context to augment your knowledge and follow any directives given.\n"
-            full_prompt_text += memory_content
-        self.history = [
-            {"role": "user", "parts": [{"text": full_prompt_text}]},
-            {"role": "model", "parts": [{"text": "Understood. I will follow these instructions and use my tools to assist you."}]}
-        ]
+        memory_signature = get_memory_signature(find_memory_files(target_dir))
+        # Nothing encoded for the previous history will be sent again.
+        self._contents_encoder.clear()
+        self.history = [_build_context_message(target_dir, memory_signature), CONTEXT_ACK_MESSAGE]
         logging.debug("Chat context initialized successfully.")
 
-    async def send_message_stream(self, prompt: PromptType) -> AsyncGenerator[Dict[str, Any], None]:
+    async def send_message_stream(self, prompt: PromptType, before_tools: Awaitable[Any] | None = None) -> AsyncGenerator[Dict[str, Any], None]:
         """
         Handles a single conversational turn, including tool calls and responses.
         This method replaces the logic previously in the Turn class.
+        If given, `before_tools` is awaited before the first tool call is scheduled.
         """
+        self._apply_background_compression()
+
         if isinstance(prompt, str):
             user_parts = [{"text": prompt}]
         else:
             user_parts = prompt
 
-        turn_history = self.history + [{"role": "user", "parts": user_parts}]
-
-        while True:
-            # FIX: Build request_components without the model. The model will be added
-            # inside _make_api_request to ensure the correct one is used on retries.
-            request_components = {"project": self.client.project_id, "request": {'contents': turn_history}}
-            if tools := self.tool_registry.get_declarations():
-                request_components["request"]['tools'] = tools
-
-            try:
-                response_stream = await self.client._make_api_request(
-                    'streamGenerateContent', request_components=request_components,
-                    stream=True, chat_session=self
-                )
-                function_calls, model_response_text = [], ""
-                async for line in response_stream.aiter_lines():
-                    if not line.startswith('data: '): continue
-                    try:
-                        data = json.loads(line[6:])
-                        part = data.get('response', {}).get('candidates', [{}])[0].get('content', {}).get('parts', [{}])[0]
-                        if 'functionCall' in part:
-                            function_calls.append(part['functionCall'])
-                        elif 'text' in part:
-                            text = part.get('text', '')
-                            model_response_text += text
-                            yield {'type': 'content', 'value': text}
-                    except (json.JSONDecodeError, KeyError, IndexError):
-                        logging.warning(f"Could not parse stream chunk: {line}")
-
-                if function_calls:
-                    turn_history.append({"role": "model", "parts": [{'functionCall': fc} for fc in function_calls]})
-                    tool_results = await self._scheduler.schedule(function_calls)
-                    awaiting_approval = tool_results.get("awaiting_approval", [])
-
-                    if awaiting_approval:
-                        call_to_confirm = awaiting_approval[0]
-                        self._pending_confirmation = call_to_confirm
-                        self._confirmation_received_event.clear()
-                        yield {'type': 'confirmation_request', 'value': call_to_confirm}
-                        await self._confirmation_received_event.wait()
-                        await self._scheduler.handle_confirmation_and_execute(
-                            self._pending_confirmation['request'], self._confirmation_outcome
-                        )
-
-                    executed_results = await self._scheduler.get_executed_results()
-                    if executed_results:
-                        turn_history.append({"role": "user", "parts": executed_results})
-                        for result in executed_results:
-                            yield {'type': 'tool_call_response', 'value': result}
-                        continue # Continue the loop to get the model's final response
-
-                self.history = turn_history
-                if model_response_text.strip():
-                    self.history.append({"role": "model", "parts": [{"text": model_response_text}]})
-                break
-            except Exception as e:
-                logging.error(f"Error during turn: {e}", exc_info=True)
-                yield {'type': 'error', 'value': str(e)}
-                break
+        # The turn is appended to the live history and rolled back if it does not
+        # complete, which avoids copying the whole history on every turn.
+        turn_history = self.history
+        turn_start = len(turn_history)
+        turn_history.append({"role": "user", "parts": user_parts})
+        completed = False
+
+        try:
+            while True:
+                # FIX: Build request_components without the model. The model is set on
+                # this dict inside _make_api_request so the correct one is used on retries;
+                # it must therefore be rebuilt for every request.
+                # The contents are encoded separately so that messages already sent
+                # earlier in this turn are not serialised again.
+                request_components = {"project": self.client.project_id, "request": {}}
+                if self._tools_payload:
+                    request_components["request"]['tools'] = self._tools_payload
+
+                try:
+                    function_calls, model_response_text = [], ""
+                    async with self.client.stream_api_request(
+                        'streamGenerateContent', request_components=request_components,
+                        chat_session=self,
+                        encoded_contents=self._contents_encoder.encode(turn_history)
+                    ) as response_stream:
+                        async for event_data in iter_sse_data(response_stream.aiter_bytes(SSE_READ_CHUNK_SIZE)):
+                            try:
+                                data = loads_json(event_data)
+                                part = data.get('response', {}).get('candidates', [{}])[0].get('content', {}).get('parts', [{}])[0]
+                                if 'functionCall' in part:
+                                    function_calls.append(part['functionCall'])
+                                elif 'text' in part:
+                                    text = part.get('text', '')
+                                    model_response_text += text
+                                    yield {'type': 'content', 'value': text}
+                            except (json.JSONDecodeError, KeyError, IndexError):
+                                logging.warning(f"Could not parse stream chunk: {bytes(event_data)!r}")
+
+                    if function_calls:
+                        if before_tools is not None:
+                            await before_tools
+                            before_tools = None
+                        turn_history.append({"role": "model", "parts": [{'functionCall': fc} for fc in function_calls]})
+                        # Tools run in a task so their completions can be reported as they happen.
+                        progress: asyncio.Queue = asyncio.Queue()
+                        schedule_task = asyncio.create_task(self._scheduler.schedule(function_calls, on_call_finished=progress.put_nowait))
+                        schedule_task.add_done_callback(lambda _: progress.put_nowait(None))
+                        try:
+                            while (finished_call := await progress.get()) is not None:
+                                yield self._tool_progress_event(finished_call)
+                            tool_results = await schedule_task
+                        finally:
+                            schedule_task.cancel()
+                        awaiting_approval = tool_results.get("awaiting_approval", [])
+
+                        if awaiting_approval:
+                            call_to_confirm = awaiting_approval[0]
+                            self._pending_confirmation = call_to_confirm
+                            self._confirmation_received_event.clear()
+                            yield {'type': 'confirmation_request', 'value': call_to_confirm}
+                            await self._confirmation_received_event.wait()
+                            confirmed_calls = []
+                            await self._scheduler.handle_confirmation_and_execute(
+                                self._pending_confirmation['request'], self._confirmation_outcome,
+                                on_call_finished=confirmed_calls.append
+                            )
+                            for finished_call in confirmed_calls:
+                                yield self._tool_progress_event(finished_call)
+
+                        executed_results = await self._scheduler.get_executed_results()
+                        if executed_results:
+                            self._last_tool_response = {"role": "user", "parts": executed_results}
+                            turn_history.append(self._last_tool_response)
+                            for result in executed_results:
+                                yield {'type': 'tool_call_response', 'value': result}
+                            continue # Continue the loop to get the model's final response
+
+                    if model_response_text.strip():
+                        turn_history.append({"role": "model", "parts": [{"text": model_response_text}]})
+                    completed = True
+                    break
+                except Exception as e:
+                    logging.error(f"Error during turn: {e}", exc_info=True)
+                    yield {'type': 'error', 'value': str(e)}
+                    break
+        finally:
+            if not completed:
+                del turn_history[turn_start:]
+
+        if completed and self._should_compress():
+            self._start_background_compression()
+
+    async def compress_old_history(self, keep: int = CHAT_WINDOW) -> bool:
+        """
+        Replaces the history between the system context and the last `keep`
+        messages with a summary. Returns True if the history was compressed.
+        """
+        history = self.history
+        compressed_prefix = await self._summarize_old_history(history, keep)
+        return compressed_prefix is not None and self._replace_prefix(history, *compressed_prefix)
+
+    async def _summarize_old_history(self, history: List[Dict[str, Any]], keep: int) -> tuple[int, List[Dict[str, Any]]] | None:
+        """Returns (cut, messages) where `messages` can stand in for `history[:cut]`, or None."""
+        # The kept window starts at a user prompt so no tool call is separated from its response.
+        cut = max(len(history) - keep, CONTEXT_PREFIX_LEN)
+        while cut < len(history) and not _is_user_prompt(history[cut]):
+            cut += 1
+        if cut <= CONTEXT_PREFIX_LEN or cut >= len(history):
+            return None
+
+        summary = await summarize_history(self, history[CONTEXT_PREFIX_LEN:cut])
+        if summary is None:
+            self._compress_failed_at = len(history)
+            return None
+        self._compress_failed_at = None
+        summary_message = {"role": "user", "parts": [{"text": SUMMARY_HEADER + summary}]}
+        return cut, history[:CONTEXT_PREFIX_LEN] + [summary_message, SUMMARY_ACK_MESSAGE]
+
+    def _replace_prefix(self, history: List[Dict[str, Any]], cut: int, messages: List[Dict[str, Any]]) -> bool:
+        """Swaps `messages` in for the first `cut` messages, if the live history still starts with `history[:cut]`."""
+        current = self.history
+        if len(current) < cut or any(current[i] is not history[i] for i in range(cut)):
+            logging.debug("History changed since it was summarised; discarding the summary.")
+            return False
+        self.history = messages + current[cut:]
+        logging.info(f"Compressed chat history from {len(current)} to {len(self.history)} messages.")
+        return True
+
+    def _should_compress(self) -> bool:
+        return (self._compression_task is None and len(self.history) > COMPRESS_THRESHOLD
+                and (self._compress_failed_at is None or len(self.history) >= self._compress_failed_at + CHAT_WINDOW))
+
+    def _start_background_compression(self):
+        # A copy, because the next turn appends to the live history while this runs.
+        history = list(self.history)
+        async def summarize():
+            return history, await self._summarize_old_history(history, CHAT_WINDOW)
+        self._compression_task = asyncio.create_task(summarize())
+
+    def _apply_background_compression(self):
+        """Swaps in a finished background summary. A summary still in progress is left running."""
+        task = self._compression_task
+        if task is None or not task.done():
+            return
+        self._compression_task = None
+        if task.cancelled() or task.exception() is not None:
+            return
+        history, compressed_prefix = task.result()
+        if compressed_prefix is not None:
+            self._replace_prefix(history, *compressed_prefix)
+
+    @staticmethod
+    def _tool_progress_event(call: Dict[str, Any]) -> Dict[str, Any]:
+        return {'type': 'tool_progress', 'value': {'name': call['request'].get('name'), 'status': call['status']}}
 
     def provide_confirmation_response(self, call_value: Dict, outcome: ToolConfirmationOutcome):
         """Called by the UI to provide the user's confirmation for a tool call."""
@@ -139,12 +274,19 @@ class ChatSession:
     async def check_next_speaker(self) -> NextSpeaker:
         if not self.history: return "user"
         last_message = self.history[-1]
+        if last_message is self._last_tool_response:
+            return "model"
+        # Histories restored from a checkpoint were not built by this session.
         if (last_message.get("role") == "user" and any("functionResponse" in p for p in last_message.get("parts",[]))):
             return "model"
         return await check_next_speaker(self)
 
     def reset(self):
         logging.info("Resetting chat session history.")
+        self._compress_failed_at = None
+        if self._compression_task is not None:
+            self._compression_task.cancel()
+            self._compression_task = None
         self._initialize_chat_context()
 
     def get_stats(self) -> Dict[str, Any]:
@@ -153,7 +295,10 @@ class ChatSession:
     async def _handle_flash_fallback(self) -> bool:
         from gemini_client import Models
         if self.model == Models.FLASH: return False
-        print(f"\n[INFO] ⚡ Persistent rate-limiting detected. Temporarily switching from {self.model} to {Models.FLASH}.")
-        logging.warning(f"Switching model from {self.model} to {Models.FLASH} due to 429 errors.")
-        self.model = Models.FLASH
-        return True
\ No newline at end of file
+        async with self._fallback_lock:
+            # Another request may have switched while we waited for the lock.
+            if self.model == Models.FLASH: return False
+            print(f"\n[INFO] ⚡ Persistent rate-limiting detected. Temporarily switching from {self.model} to {Models.FLASH}.")
+            logging.warning(f"Switching model from {self.model} to {Models.FLASH} due to 429 errors.")
+            self.model = Models.FLASH
+            return True
\ No newline at end of file
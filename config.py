@@ -1,9 +1,8 @@
 #
 # File: config.py
-# Revision: 9
-# Description: CRITICAL FIX. Reverts the DEFAULT_MODEL constant from the
-# incorrect "1.5" version back to the correct "2.5-pro" version.
-# This fixes the bug causing the application to start with the wrong model.
+# Revision: 10
+# Description: Adds `get_tool_registry`, a lazily created singleton, so every
+# chat session for this config shares one ToolRegistry.
 #
 
 import argparse
@@ -12,7 +11,7 @@ import logging
 import os
 import re
 from pathlib import Path
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, TYPE_CHECKING
 
 from dotenv import load_dotenv
 
@@ -20,6 +19,9 @@ from services.file_discovery_service import FileDiscoveryService
 from services.git_service import GitService
 from logger import Logger
 
+if TYPE_CHECKING:
+    from tool_registry import ToolRegistry
+
 # --- Constants ---
 SETTINGS_DIRECTORY_NAME = '.gemini'
 USER_SETTINGS_DIR = Path.home() / SETTINGS_DIRECTORY_NAME
@@ -40,6 +42,7 @@ class Config:
         self._file_service: Optional[FileDiscoveryService] = None
         self._git_service: Optional[GitService] = None
         self._logger: Optional[Logger] = None
+        self._tool_registry: Optional['ToolRegistry'] = None
 
     def get_target_dir(self) -> Path:
         return self._target_dir
@@ -62,6 +65,14 @@ class Config:
             self._logger = Logger(self._target_dir)
         return self._logger
 
+    def get_tool_registry(self) -> 'ToolRegistry':
+        """Initializes and returns the singleton ToolRegistry shared by all chat sessions."""
+        if self._tool_registry is None:
+            # Imported here because the tools themselves import this module.
+            from tool_registry import ToolRegistry
+            self._tool_registry = ToolRegistry(self)
+        return self._tool_registry
+
     def get_model(self) -> str:
         return self._config.get("model", DEFAULT_MODEL)
 
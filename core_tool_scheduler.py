@@ -1,14 +1,16 @@
 #
 # File: core_tool_scheduler.py
-# Revision: 6
-# Description: Finalized the response formatting to pass a dictionary
-# directly in the 'content' field, preventing downstream parsing errors.
+# Revision: 9
+# Description: `on_call_finished` is passed down to each execution rather
+# than kept on the scheduler, and `handle_confirmation_and_execute` accepts
+# one too, so confirmed calls report completion and no callback outlives its
+# batch.
 #
 
 import asyncio
 import json
 import logging
-from typing import List, Dict, Any, Literal, TypedDict, TYPE_CHECKING
+from typing import Callable, List, Dict, Any, Literal, TypedDict, TYPE_CHECKING
 
 from tool_registry import ToolRegistry
 from tools.tool_io import ToolConfirmationOutcome
@@ -16,6 +18,8 @@ from tools.tool_io import ToolConfirmationOutcome
 if TYPE_CHECKING:
     from turn import Turn
 
+DEFAULT_MAX_TOOL_CONCURRENCY = 8
+
 ToolCallStatus = Literal["validating", "awaiting_approval", "executing", "success", "error", "cancelled"]
 
 class BaseToolCall(TypedDict, total=False):
@@ -27,24 +31,25 @@ class BaseToolCall(TypedDict, total=False):
 
 class CoreToolScheduler:
     """Manages the lifecycle of tool calls, including user confirmation."""
-    def __init__(self, tool_registry: ToolRegistry):
+    def __init__(self, tool_registry: ToolRegistry, max_concurrency: int = DEFAULT_MAX_TOOL_CONCURRENCY):
         self._tool_registry = tool_registry
         self._tool_calls: List[BaseToolCall] = []
+        self._concurrency_limit = asyncio.Semaphore(max_concurrency)
         logging.debug("CoreToolScheduler initialized.")
 
     def clear_state(self):
         self._tool_calls = []
 
-    async def schedule(self, function_calls: List[Dict[str, Any]]) -> Dict[str, Any]:
+    async def schedule(self, function_calls: List[Dict[str, Any]], on_call_finished: Callable[[BaseToolCall], None] | None = None) -> Dict[str, Any]:
         self.clear_state()
         for fc in function_calls:
             tool_name = fc.get("name")
             tool = self._tool_registry.get_tool(tool_name)
             self._tool_calls.append({"request": fc, "status": "validating", "tool": tool})
-        return await self._process_tool_calls()
+        return await self._process_tool_calls(on_call_finished)
 
-    async def _process_tool_calls(self) -> Dict[str, Any]:
-        execution_tasks = []
+    async def _process_tool_calls(self, on_call_finished: Callable[[BaseToolCall], None] | None) -> Dict[str, Any]:
+        calls_to_execute = []
         for call in self._tool_calls:
             if call["status"] == "validating":
                 tool = call["tool"]
@@ -59,20 +64,22 @@ class CoreToolScheduler:
                 else:
                     call["status"] = "executing"
             if call["status"] == "executing":
-                execution_tasks.append(self._execute_call(call))
-        if execution_tasks:
-            await asyncio.gather(*execution_tasks)
+                calls_to_execute.append(call)
+        if calls_to_execute:
+            async with asyncio.TaskGroup() as tg:
+                for call in calls_to_execute:
+                    tg.create_task(self._execute_call_bounded(call, on_call_finished))
         awaiting_approval_calls = [c for c in self._tool_calls if c["status"] == "awaiting_approval"]
         executed_results = [c["response"] for c in self._tool_calls if "response" in c]
         return {"awaiting_approval": awaiting_approval_calls, "executed_results": executed_results}
 
-    async def handle_confirmation_and_execute(self, call_request: Dict, outcome: ToolConfirmationOutcome):
+    async def handle_confirmation_and_execute(self, call_request: Dict, outcome: ToolConfirmationOutcome, on_call_finished: Callable[[BaseToolCall], None] | None = None):
         for call in self._tool_calls:
             if call["request"] == call_request and call["status"] == "awaiting_approval":
                 if outcome in [ToolConfirmationOutcome.PROCEED_ONCE, ToolConfirmationOutcome.PROCEED_ALWAYS]:
                     logging.debug(f"User approved tool call: {call_request['name']}")
                     call["status"] = "executing"
-                    await self._execute_call(call)
+                    await self._execute_call(call, on_call_finished)
                 else:
                     logging.debug(f"User cancelled tool call: {call_request['name']}")
                     call["status"] = "cancelled"
@@ -82,7 +89,11 @@ class CoreToolScheduler:
     async def get_executed_results(self) -> List[Dict[str, Any]]:
         return [c["response"] for c in self._tool_calls if "response" in c and c["status"] != 'awaiting_approval']
 
-    async def _execute_call(self, call: BaseToolCall):
+    async def _execute_call_bounded(self, call: BaseToolCall, on_call_finished: Callable[[BaseToolCall], None] | None = None):
+        async with self._concurrency_limit:
+            await self._execute_call(call, on_call_finished)
+
+    async def _execute_call(self, call: BaseToolCall, on_call_finished: Callable[[BaseToolCall], None] | None = None):
         if call.get("status") != "executing" or "response" in call:
             return
         tool, name, args = call["tool"], call["request"]["name"], call["request"].get("args", {})
@@ -92,6 +103,8 @@ class CoreToolScheduler:
             call["status"], call["response"] = "success", self._format_success_response(call["request"], result)
         except Exception as e:
             call["status"], call["response"] = "error", self._format_error_response(call["request"], str(e))
+        if on_call_finished:
+            on_call_finished(call)
 
     def _format_success_response(self, request: Dict, result: Dict) -> Dict:
         return {"functionResponse": {"name": request["name"], "response": {"content": result}}}
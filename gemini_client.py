@@ -1,38 +1,60 @@
 #
 # File: gemini_client.py
-# Revision: 32
-# Description: CRITICAL FIX. Reverts the model names in the Models class
-# from the incorrect "1.5" version back to the correct "2.5" versions,
-# which are used by the cloudcode-pa.googleapis.com endpoint.
+# Revision: 67
+# Description: A token refresh returns new Credentials built from public
+# constructor arguments instead of writing google-auth's private fields.
 #
 
 import os
 import json
 import time
+import random
 import secrets
-import threading
 import webbrowser
-import http.server
-import socketserver
 import urllib.parse
 import asyncio
 import logging
 import platform
+import datetime
+import contextlib
+import itertools
 from pathlib import Path
-from typing import Union, List, Dict, Any, TYPE_CHECKING
+from typing import Union, List, Dict, Any, AsyncIterator, TYPE_CHECKING
 
 import httpx
 from google.oauth2.credentials import Credentials
-from google.auth.transport.requests import Request
 from google.auth.exceptions import RefreshError
 
 from config import Config
-from utils.retry import retry_with_backoff, RetryOptions
+from utils.retry import retry_with_backoff, RetryOptions, is_retryable_status
 from utils.errors import to_friendly_error
+from utils.request_encoding import build_request_body, dumps_compact, loads_json
+
+try:
+    import h2  # noqa: F401 -- httpx enables HTTP/2 only when h2 is installed.
+    _HTTP2_AVAILABLE = True
+except ImportError:
+    _HTTP2_AVAILABLE = False
 
 if TYPE_CHECKING:
     from chat_session import ChatSession
 
+_PLATFORM_PREFIXES = {"darwin": "DARWIN", "linux": "LINUX", "windows": "WINDOWS"}
+
+def _detect_platform() -> str:
+    prefix = _PLATFORM_PREFIXES.get(platform.system().lower())
+    return f"{prefix}_{platform.machine().upper()}" if prefix else "PLATFORM_UNSPECIFIED"
+
+PLATFORM_ID = _detect_platform()
+
+def _http_response(status: str, body: bytes) -> bytes:
+    head = f"HTTP/1.1 {status}\r\nContent-Type: text/html\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n"
+    return head.encode('ascii') + body
+
+_OAUTH_SUCCESS_RESPONSE = _http_response("200 OK", b"<html><body><h1>Authentication successful!</h1><p>You can close this window.</p></body></html>")
+_OAUTH_STATE_MISMATCH_RESPONSE = _http_response("400 Bad Request", b"State mismatch error.")
+_OAUTH_FAILED_RESPONSE = _http_response("400 Bad Request", b"Authentication failed.")
+
 class Models:
     """Available Gemini model variants with their identifiers."""
     # FIX: Reverted to the correct model versions.
@@ -55,12 +77,24 @@ class GeminiClient:
         "https://www.googleapis.com/auth/userinfo.email",
         "https://www.googleapis.com/auth/userinfo.profile"
     ]
+    _OAUTH_SCOPES_STR = " ".join(_OAUTH_SCOPES)
+    # One explicit address: "localhost" may bind IPv4 and IPv6 on different ports.
+    _OAUTH_CALLBACK_HOST = "127.0.0.1"
+    _OAUTH_REDIRECT_URI_TEMPLATE = "http://{host}:{port}/oauth2callback"
     _CREDENTIALS_FILENAME = "oauth_creds.json"
     _TOKEN_URI = "https://oauth2.googleapis.com/token"
     _AUTH_URI = "https://accounts.google.com/o/oauth2/auth"
     _CODE_ASSIST_ENDPOINT = "https://cloudcode-pa.googleapis.com"
     _API_VERSION = "v1internal"
     _PLUGIN_VERSION = "1.0.0"
+    _USER_AGENT = f"GeminiCLI-Python-Client/{_PLUGIN_VERSION}"
+    _BEARER_PREFIX = "Bearer "
+    _TOKEN_REFRESH_MARGIN_S = 300
+    _OAUTH_TIMEOUT_S = 300
+    _LRO_POLL_DELAYS_S = (0.25, 0.5, 1.0, 2.0)
+    _LRO_MAX_POLL_DELAY_S = 5.0
+    _LRO_POLL_JITTER = 0.2
+    _LRO_TIMEOUT_S = 120.0
 
     def __init__(self, config: Config, credentials_dir: Path = None):
         self.config = config
@@ -68,102 +102,225 @@ class GeminiClient:
             self.credentials_path = Path.home() / ".gemini" / self._CREDENTIALS_FILENAME
         else:
             self.credentials_path = credentials_dir / self._CREDENTIALS_FILENAME
-        self.credentials = self._get_credentials()
+        self.credentials: Credentials | None = None
         self.project_id = None
-        self.http_client = httpx.AsyncClient(timeout=300.0)
+        self._client_metadata: Dict[str, Any] = {
+            'ideType': 'IDE_UNSPECIFIED', 'platform': PLATFORM_ID,
+            'pluginType': 'GEMINI', 'pluginVersion': self._PLUGIN_VERSION,
+        }
+        self._client_metadata_header = ",".join(f"{k}={v}" for k, v in self._client_metadata.items())
+        self.http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(300.0, connect=10.0),
+            http2=_HTTP2_AVAILABLE,
+            limits=httpx.Limits(max_keepalive_connections=8, max_connections=16, keepalive_expiry=60.0),
+            headers={
+                'Content-Type': 'application/json',
+                'User-Agent': self._USER_AGENT,
+                'Client-Metadata': self._client_metadata_header,
+            },
+        )
+        self._token_deadline = 0.0
+        self._refresh_lock = asyncio.Lock()
+        self._refresh_task: asyncio.Task | None = None
 
     async def aclose(self):
+        if self._refresh_task:
+            self._refresh_task.cancel()
         await self.http_client.aclose()
 
     async def initialize_user(self):
+        self.credentials = await self._get_credentials()
+        self._cache_token_state()
+        self._refresh_task = asyncio.create_task(self._proactive_refresh_loop())
         self.project_id = await self._setup_user()
         logging.info(f"User setup complete. Using Project ID: {self.project_id or 'N/A'}")
 
-    def start_chat(self, config: Config, model: str) -> 'ChatSession':
-        from chat_session import ChatSession
-        return ChatSession(self, config, model)
-
-    def _get_platform(self) -> str:
-        system = platform.system().lower()
-        arch = platform.machine().lower()
-        if system == "darwin": return f"DARWIN_{arch.upper()}"
-        if system == "linux": return f"LINUX_{arch.upper()}"
-        if system == "windows": return f"WINDOWS_{arch.upper()}"
-        return "PLATFORM_UNSPECIFIED"
-
-    def _get_client_metadata(self) -> Dict[str, Any]:
-        return {
-            'ideType': 'IDE_UNSPECIFIED', 'platform': self._get_platform(),
-            'pluginType': 'GEMINI', 'pluginVersion': self._PLUGIN_VERSION,
-        }
+    def _token_expires_soon(self) -> bool:
+        """True if the access token is missing or expires within the refresh margin."""
+        if not self.credentials.token:
+            return True
+        if self.credentials.expiry is None:
+            return False
+        return self._seconds_until_expiry() < self._TOKEN_REFRESH_MARGIN_S
 
-    def _get_credentials(self) -> Credentials:
-        if self.credentials_path.exists():
+    def _seconds_until_expiry(self) -> float:
+        # google-auth stores expiry as a naive UTC datetime.
+        now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        return (self.credentials.expiry - now).total_seconds()
+
+    async def _ensure_fresh_token(self):
+        """Refreshes the access token in a worker thread so the event loop is never blocked."""
+        if time.monotonic() < self._token_deadline:
+            return
+        async with self._refresh_lock:
+            # Another task may have refreshed while we waited for the lock.
+            if self._token_expires_soon():
+                self.credentials = await self._refresh_access_token(self.credentials)
+                self._cache_token_state()
+                logging.debug("Access token refreshed.")
+                try:
+                    await asyncio.to_thread(self._save_credentials, self.credentials)
+                except OSError as e:
+                    logging.warning(f"Could not persist refreshed credentials: {e}")
+
+    def _cache_token_state(self):
+        """Caches the bearer header and refresh deadline derived from the current token."""
+        self.http_client.headers['Authorization'] = self._BEARER_PREFIX + (self.credentials.token or '')
+        if not self.credentials.token:
+            self._token_deadline = 0.0
+        elif self.credentials.expiry is None:
+            self._token_deadline = float('inf')
+        else:
+            self._token_deadline = time.monotonic() + self._seconds_until_expiry() - self._TOKEN_REFRESH_MARGIN_S
+
+    async def _proactive_refresh_loop(self):
+        """Refreshes the token shortly before it expires so requests never pay the refresh latency."""
+        while self.credentials.expiry is not None:
+            # Tokens already near expiry are refreshed on demand by the next request;
+            # the floor keeps this loop from spinning on a short-lived token.
+            delay_s = self._seconds_until_expiry() - self._TOKEN_REFRESH_MARGIN_S
+            await asyncio.sleep(max(delay_s, 30))
+            try:
+                await self._ensure_fresh_token()
+            except Exception as e:
+                logging.warning(f"Proactive token refresh failed, will refresh on demand: {e}")
+                return
+
+    async def _get_credentials(self) -> Credentials:
+        creds = await asyncio.to_thread(self._load_saved_credentials)
+        if creds and not creds.valid:
+            print("Credentials expired, refreshing...")
             try:
-                creds = Credentials.from_authorized_user_file(str(self.credentials_path), self._OAUTH_SCOPES)
-                if creds and creds.valid: return creds
-                if creds and creds.expired and creds.refresh_token:
-                    print("Credentials expired, refreshing...")
-                    creds.refresh(Request())
-                    self._save_credentials(creds)
-                    return creds
+                creds = await self._refresh_access_token(creds)
+                await asyncio.to_thread(self._save_credentials, creds)
             except Exception as e:
                 print(f"Could not load or refresh credentials, re-authenticating: {e}")
-        return self._run_oauth_flow()
+                creds = None
+        return creds or await self._run_oauth_flow()
+
+    def _load_saved_credentials(self) -> Credentials | None:
+        """Loads stored credentials that are valid or refreshable. Blocking; run in a worker thread."""
+        try:
+            data = self.credentials_path.read_bytes()
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            print(f"Could not load or refresh credentials, re-authenticating: {e}")
+            return None
+        try:
+            creds = Credentials.from_authorized_user_info(loads_json(data), self._OAUTH_SCOPES)
+            if creds and (creds.valid or (creds.expired and creds.refresh_token)): return creds
+        except Exception as e:
+            print(f"Could not load or refresh credentials, re-authenticating: {e}")
+        return None
+
+    @staticmethod
+    def _expiry_after(expires_in_s: float) -> datetime.datetime:
+        # google-auth compares expiry against a naive UTC datetime.
+        now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        return now + datetime.timedelta(seconds=expires_in_s)
+
+    async def _refresh_access_token(self, creds: Credentials) -> Credentials:
+        """
+        Exchanges the refresh token for a new access token over the shared
+        connection pool. Returns new credentials; `creds` is left unchanged.
+        """
+        if not creds.refresh_token:
+            raise RefreshError("No refresh token available; please log in again.")
+        token_data = {'grant_type': 'refresh_token', 'refresh_token': creds.refresh_token, 'client_id': creds.client_id or self._OAUTH_CLIENT_ID, 'client_secret': creds.client_secret or self._OAUTH_CLIENT_SECRET}
+        request = self.http_client.build_request('POST', creds.token_uri or self._TOKEN_URI, data=token_data, headers={'Content-Type': 'application/x-www-form-urlencoded'})
+        # The token endpoint must not receive the (expired) bearer token.
+        request.headers.pop('Authorization', None)
+        response = await self.http_client.send(request)
+        if response.is_error:
+            raise RefreshError(f"Token refresh failed with HTTP {response.status_code}: {response.text}")
+        token_info = loads_json(response.content)
+        # The token endpoint may rotate the refresh token.
+        return Credentials(
+            token=token_info['access_token'], refresh_token=token_info.get('refresh_token') or creds.refresh_token,
+            token_uri=creds.token_uri or self._TOKEN_URI, client_id=creds.client_id or self._OAUTH_CLIENT_ID,
+            client_secret=creds.client_secret or self._OAUTH_CLIENT_SECRET, scopes=creds.scopes,
+            expiry=self._expiry_after(token_info['expires_in']) if 'expires_in' in token_info else None)
 
     def _save_credentials(self, creds: Credentials):
+        new_content = creds.to_json().encode('utf-8')
+        try:
+            if self.credentials_path.read_bytes() == new_content:
+                logging.debug("Credentials unchanged, not rewriting %s", self.credentials_path)
+                return
+        except OSError:
+            pass
         self.credentials_path.parent.mkdir(parents=True, exist_ok=True)
-        with open(self.credentials_path, 'w') as f:
-            f.write(creds.to_json())
+        tmp_path = self.credentials_path.with_name(f"{self.credentials_path.name}.{os.getpid()}.tmp")
+        try:
+            # No fsync: a lost write only means logging in again on the next run.
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_CLOEXEC', 0), 0o600)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(new_content)
+            os.replace(tmp_path, self.credentials_path)
+        except OSError:
+            tmp_path.unlink(missing_ok=True)
+            raise
         logging.info(f"Credentials saved to {self.credentials_path}")
 
-    def _run_oauth_flow(self) -> Credentials:
+    async def _run_oauth_flow(self) -> Credentials:
         print("Gemini login required.")
-        auth_code, server_thread, httpd, state = None, None, None, secrets.token_urlsafe(16)
-        class OAuthCallbackHandler(http.server.SimpleHTTPRequestHandler):
-            def do_GET(self):
-                nonlocal auth_code
-                parsed_path = urllib.parse.urlparse(self.path)
-                query_params = urllib.parse.parse_qs(parsed_path.query)
+        state = secrets.token_urlsafe(16)
+        # Resolves to (auth_code, auth_error) once a callback with a valid state arrives.
+        callback_result: asyncio.Future = asyncio.get_running_loop().create_future()
+        async def handle_callback(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+            try:
+                # Read up to the blank line so closing the socket does not reset unread headers.
+                request_head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout=5)
+                request_line = request_head.split(b"\r\n", 1)[0].decode('latin-1')
+                target = request_line.split(' ')[1] if request_line.count(' ') >= 2 else ''
+                query_params = urllib.parse.parse_qs(urllib.parse.urlparse(target).query)
                 if query_params.get('state', [None])[0] != state:
-                    self.send_response(400); self.end_headers(); self.wfile.write(b"State mismatch error.")
-                    return
-                if 'code' in query_params:
-                    auth_code = query_params['code'][0]
-                    self.send_response(200); self.end_headers(); self.wfile.write(b"<html><body><h1>Authentication successful!</h1><p>You can close this window.</p></body></html>")
+                    writer.write(_OAUTH_STATE_MISMATCH_RESPONSE)
+                elif 'code' in query_params:
+                    writer.write(_OAUTH_SUCCESS_RESPONSE)
+                    if not callback_result.done(): callback_result.set_result((query_params['code'][0], None))
                 else:
-                    self.send_response(400); self.end_headers(); self.wfile.write(b"Authentication failed.")
-        def start_server():
-            nonlocal httpd
-            with socketserver.TCPServer(("localhost", 0), OAuthCallbackHandler) as s:
-                httpd = s
-                httpd.serve_forever()
-        server_thread = threading.Thread(target=start_server)
-        server_thread.daemon = True
-        server_thread.start()
-        time.sleep(0.1)
-        if not httpd: raise Exception("Failed to start local server for OAuth callback.")
-        port = httpd.server_address[1]
-        redirect_uri = f'http://localhost:{port}/oauth2callback'
-        params = {'response_type': 'code', 'client_id': self._OAUTH_CLIENT_ID, 'redirect_uri': redirect_uri, 'scope': ' '.join(self._OAUTH_SCOPES), 'state': state, 'access_type': 'offline', 'prompt': 'consent'}
-        auth_url = f"{self._AUTH_URI}?{urllib.parse.urlencode(params)}"
-        print(f"Attempting to open authentication page in your browser.\nIf it does not open, please navigate to this URL:\n\n{auth_url}\n")
-        webbrowser.open(auth_url)
-        while auth_code is None: time.sleep(0.5)
-        httpd.shutdown(); httpd.server_close()
+                    writer.write(_OAUTH_FAILED_RESPONSE)
+                    if not callback_result.done(): callback_result.set_result((None, query_params.get('error', ['unknown error'])[0]))
+                await writer.drain()
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError) as e:
+                logging.debug("Ignoring failed OAuth callback connection: %s", e)
+            finally:
+                writer.close()
+        try:
+            server = await asyncio.start_server(handle_callback, self._OAUTH_CALLBACK_HOST, 0, reuse_address=True)
+        except OSError as e:
+            raise Exception(f"Failed to start local server for OAuth callback: {e}") from e
+        async with server:
+            port = server.sockets[0].getsockname()[1]
+            redirect_uri = self._OAUTH_REDIRECT_URI_TEMPLATE.format(host=self._OAUTH_CALLBACK_HOST, port=port)
+            params = {'response_type': 'code', 'client_id': self._OAUTH_CLIENT_ID, 'redirect_uri': redirect_uri, 'scope': self._OAUTH_SCOPES_STR, 'state': state, 'access_type': 'offline', 'prompt': 'consent'}
+            auth_url = f"{self._AUTH_URI}?{urllib.parse.urlencode(params)}"
+            print(f"Attempting to open authentication page in your browser.\nIf it does not open, please navigate to this URL:\n\n{auth_url}\n")
+            await asyncio.to_thread(webbrowser.open, auth_url)
+            try:
+                auth_code, auth_error = await asyncio.wait_for(callback_result, timeout=self._OAUTH_TIMEOUT_S)
+            except asyncio.TimeoutError:
+                raise TimeoutError(f"Timed out after {self._OAUTH_TIMEOUT_S}s waiting for the OAuth callback.") from None
+        if auth_error: raise Exception(f"Authentication failed: {auth_error}")
         token_data = {'code': auth_code, 'client_id': self._OAUTH_CLIENT_ID, 'client_secret': self._OAUTH_CLIENT_SECRET, 'redirect_uri': redirect_uri, 'grant_type': 'authorization_code'}
-        response = httpx.post(self._TOKEN_URI, data=token_data)
+        # The client's default Content-Type is JSON, so the form encoding must be set explicitly.
+        response = await self.http_client.post(self._TOKEN_URI, data=token_data, headers={'Content-Type': 'application/x-www-form-urlencoded'})
         response.raise_for_status()
-        token_info = response.json()
+        token_info = loads_json(response.content)
         creds = Credentials(token=token_info['access_token'], refresh_token=token_info.get('refresh_token'), token_uri=self._TOKEN_URI, client_id=self._OAUTH_CLIENT_ID, client_secret=self._OAUTH_CLIENT_SECRET, scopes=token_info['scope'].split())
+        if 'expires_in' in token_info:
+            creds.expiry = self._expiry_after(token_info['expires_in'])
         print("Authentication successful.")
-        self._save_credentials(creds)
+        await asyncio.to_thread(self._save_credentials, creds)
         return creds
 
     async def _setup_user(self) -> str:
         print("Performing user onboarding...")
         initial_project_id = os.environ.get("GOOGLE_CLOUD_PROJECT")
-        client_metadata = self._get_client_metadata()
+        # Copied because the onboarding requests add `duetProject` to it.
+        client_metadata = self._client_metadata.copy()
         if initial_project_id: client_metadata['duetProject'] = initial_project_id
         load_assist_req = {'metadata': client_metadata}
         if initial_project_id: load_assist_req['cloudaicompanionProject'] = initial_project_id
@@ -179,47 +336,96 @@ class GeminiClient:
             if lro_res.get('done') and 'response' in lro_res:
                 return lro_res.get('response', {}).get('cloudaicompanionProject', {}).get('id', '')
             raise Exception(f"Failed to start onboarding: {lro_res}")
+        poll_delays = itertools.chain(self._LRO_POLL_DELAYS_S, itertools.repeat(self._LRO_MAX_POLL_DELAY_S))
+        if not lro_res.get('done', False):
+            logging.info("Onboarding in progress...")
+            # Check once straight away in case the operation finished synchronously.
+            lro_res = await self._make_api_request(operation_name, http_method='GET')
+        deadline = time.monotonic() + self._LRO_TIMEOUT_S
         while not lro_res.get('done', False):
-            print("Onboarding in progress, waiting 5 seconds...")
-            await asyncio.sleep(5)
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f"Onboarding did not complete within {self._LRO_TIMEOUT_S:.0f}s (operation: {operation_name}).")
+            delay_s = next(poll_delays) * random.uniform(1 - self._LRO_POLL_JITTER, 1 + self._LRO_POLL_JITTER)
+            logging.debug("Onboarding not done yet, polling again in %.2fs", delay_s)
+            await asyncio.sleep(delay_s)
             lro_res = await self._make_api_request(operation_name, http_method='GET')
         project_id = lro_res.get('response', {}).get('cloudaicompanionProject', {}).get('id', '')
         if not project_id: logging.warning("Onboarding complete but no project ID returned.")
         return project_id
 
-    async def _make_api_request(self, endpoint: str, body: Dict[str, Any] = None, stream: bool = False, http_method: str = 'POST', chat_session: 'ChatSession' = None, request_components: Dict[str, Any] = None) -> Union[Dict[str, Any], httpx.Response]:
+    async def _make_api_request(self, endpoint: str, body: Dict[str, Any] = None, stream: bool = False, http_method: str = 'POST', chat_session: 'ChatSession' = None, request_components: Dict[str, Any] = None, encoded_contents: bytes = None) -> Union[Dict[str, Any], httpx.Response]:
+        method = http_method.upper()
+        if method not in ('POST', 'GET'):
+            raise ValueError(f"Unsupported HTTP method: {http_method}")
+        url = f"{self._CODE_ASSIST_ENDPOINT}/{endpoint}" if endpoint.startswith('operations/') else f"{self._CODE_ASSIST_ENDPOINT}/{self._API_VERSION}:{endpoint}"
+        params = {'alt': 'sse'} if stream else None
+
+        # request_components is built fresh by the caller for each request, so
+        # the model is set on it in place rather than on a copy.
+        final_body = None
+        if request_components and chat_session:
+            final_body = request_components
+        elif body:
+            final_body = body
+
+        encoded_body: tuple[str | None, bytes | None] | None = None
+
+        def encode_body() -> bytes | None:
+            """Returns the serialised body, reusing the previous attempt's bytes when the model is unchanged."""
+            nonlocal encoded_body
+            model = chat_session.model if request_components and chat_session else None
+            if encoded_body is not None and encoded_body[0] == model:
+                return encoded_body[1]
+            if model is not None:
+                final_body["model"] = model
+            debug_enabled = logging.getLogger().isEnabledFor(logging.DEBUG)
+            if debug_enabled:
+                logging.debug("Making API call: %s %s with payload: %s", method, url, json.dumps(final_body, indent=2))
+            if encoded_contents is not None:
+                content = build_request_body(final_body, encoded_contents)
+                if debug_enabled:
+                    logging.debug("Request body size: %d bytes (contents: %d bytes)", len(content), len(encoded_contents))
+            else:
+                content = dumps_compact(final_body) if final_body is not None else None
+            encoded_body = (model, content)
+            return content
+
         async def api_call():
-            if not self.credentials.valid: self.credentials.refresh(Request())
-            client_metadata_str = ",".join([f"{k}={v}" for k, v in self._get_client_metadata().items()])
-            headers = {'Authorization': f'Bearer {self.credentials.token}', 'Content-Type': 'application/json', 'User-Agent': f'GeminiCLI-Python-Client/{self._PLUGIN_VERSION}', 'Client-Metadata': client_metadata_str}
-            url = f"{self._CODE_ASSIST_ENDPOINT}/{endpoint}" if endpoint.startswith('operations/') else f"{self._CODE_ASSIST_ENDPOINT}/{self._API_VERSION}:{endpoint}"
-            params = {'alt': 'sse'} if stream else {}
-            
-            final_body = None
-            if request_components and chat_session:
-                final_body = request_components.copy()
-                final_body["model"] = chat_session.model
-            elif body:
-                final_body = body
-
-            logging.debug(f"Making API call: {http_method.upper()} {url} with payload: {json.dumps(final_body, indent=2)}")
-            
-            if http_method.upper() == 'POST':
-                request = self.http_client.build_request("POST", url, headers=headers, json=final_body, params=params)
-            elif http_method.upper() == 'GET':
-                request = self.http_client.build_request("GET", url, headers=headers, params=params)
+            await self._ensure_fresh_token()
+            if method == 'POST':
+                request = self.http_client.build_request("POST", url, content=encode_body(), params=params)
             else:
-                raise ValueError(f"Unsupported HTTP method: {http_method}")
+                logging.debug("Making API call: %s %s", method, url)
+                request = self.http_client.build_request("GET", url, params=params)
             
             response = await self.http_client.send(request, stream=stream)
-            response.raise_for_status()
+            if response.is_error:
+                if stream:
+                    # Read the error body now so the connection is released back to the pool.
+                    await response.aread()
+                if is_retryable_status(response.status_code):
+                    response.raise_for_status()
+            # Non-retryable errors skip the retry machinery and are raised below.
             return response
             
         retry_options = RetryOptions(on_persistent_429=chat_session._handle_flash_fallback if chat_session else None)
         try:
             response = await retry_with_backoff(api_call, options=retry_options)
-            return response if stream else response.json()
+            response.raise_for_status()
+            return response if stream else loads_json(response.content)
         except httpx.HTTPStatusError as e:
             raise await to_friendly_error(e) from e
         except Exception as e:
-            raise e
\ No newline at end of file
+            raise e
+
+    @contextlib.asynccontextmanager
+    async def stream_api_request(self, endpoint: str, **kwargs) -> AsyncIterator[httpx.Response]:
+        """
+        Opens a streaming API request and guarantees the response is closed
+        when the block exits, even if the consumer stops reading early.
+        """
+        response = await self._make_api_request(endpoint, stream=True, **kwargs)
+        try:
+            yield response
+        finally:
+            await response.aclose()
\ No newline at end of file
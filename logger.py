@@ -1,67 +1,176 @@
 #
 # File: logger.py
-# Revision: 3
-# Description: Upgrades checkpoint format to a dictionary containing both
-# the 'history' and the 'commit_hash'. This links a conversation state
-# to a specific file system snapshot, enabling the /restore feature.
+# Revision: 10
+# Description: Checkpoint lines that are valid JSON but not records (not an
+# object) are skipped with a warning instead of aborting the load.
 #
 
+import os
 import json
 import logging
+import functools
+import threading
 from pathlib import Path
 from typing import List, Dict, Any, Optional
 
 from utils.paths import get_project_temp_dir
+from utils.request_encoding import dumps_compact, loads_json
 
 CheckpointData = Dict[str, Any]
 
+CHECKPOINT_COMPACT_EVERY = 20
+
+class _SavedCheckpoint:
+    """What this process last wrote to one checkpoint file."""
+    __slots__ = ("messages", "commit_hash", "appends", "file_id")
+
+    def __init__(self, messages: List[Dict[str, Any]], commit_hash: Optional[str], file_id: Optional[tuple]):
+        self.messages = messages
+        self.commit_hash = commit_hash
+        self.appends = 0
+        # (st_ino, st_size) of the file after our last write.
+        self.file_id = file_id
+
 class Logger:
     """
     Manages saving and loading of conversation checkpoints, including git snapshots.
     """
     def __init__(self, project_root: Path):
         self._temp_dir = get_project_temp_dir(str(project_root))
+        self._saved: Dict[Path, _SavedCheckpoint] = {}
+        self._save_lock = threading.Lock()
 
-    def _get_checkpoint_path(self, tag: Optional[str] = None) -> Path:
+    def _get_checkpoint_path(self, tag: Optional[str] = None, suffix: str = ".jsonl") -> Path:
         """Gets the file path for a given checkpoint tag."""
-        filename = f"checkpoint-{tag}.json" if tag else "checkpoint.json"
-        return self._temp_dir / filename
+        return self._checkpoint_path(self._temp_dir, tag, suffix)
+
+    @staticmethod
+    @functools.lru_cache(maxsize=128)
+    def _checkpoint_path(temp_dir: Path, tag: Optional[str], suffix: str) -> Path:
+        filename = f"checkpoint-{tag}{suffix}" if tag else f"checkpoint{suffix}"
+        return temp_dir / filename
 
     def save_checkpoint(self, history: List[Dict[str, Any]], commit_hash: Optional[str], tag: Optional[str] = None):
-        """Saves the chat history and commit hash to a checkpoint file."""
+        """
+        Saves the chat history and commit hash to a checkpoint file. History
+        messages must not be mutated once saved; new ones are appended.
+        """
+        with self._save_lock:
+            self._save_checkpoint(history, commit_hash, tag)
+
+    def _save_checkpoint(self, history: List[Dict[str, Any]], commit_hash: Optional[str], tag: Optional[str]):
         checkpoint_file = self._get_checkpoint_path(tag)
-        checkpoint_data: CheckpointData = {
-            "history": history,
-            "commit_hash": commit_hash
-        }
+        saved = self._saved.get(checkpoint_file)
+        extends_saved = (
+            saved is not None
+            and len(history) >= len(saved.messages)
+            and all(a is b for a, b in zip(history, saved.messages))
+        )
+        if extends_saved and (saved.file_id is None or self._file_id(checkpoint_file) != saved.file_id):
+            logging.warning(f"Checkpoint {checkpoint_file} changed outside this session; rewriting it.")
+            extends_saved = False
         try:
-            self._temp_dir.mkdir(parents=True, exist_ok=True)
-            with open(checkpoint_file, 'w', encoding='utf-8') as f:
-                json.dump(checkpoint_data, f, indent=2)
+            if extends_saved and saved.appends < CHECKPOINT_COMPACT_EVERY:
+                new_messages = history[len(saved.messages):]
+                if not new_messages and commit_hash == saved.commit_hash:
+                    logging.debug("Checkpoint unchanged, not rewriting %s", checkpoint_file)
+                    return
+                with open(checkpoint_file, 'ab') as f:
+                    f.write(self._encode_records(new_messages, commit_hash))
+                saved.messages = list(history)
+                saved.commit_hash = commit_hash
+                saved.appends += 1
+                saved.file_id = self._file_id(checkpoint_file)
+            else:
+                self._rewrite_checkpoint(checkpoint_file, history, commit_hash)
+                self._saved[checkpoint_file] = _SavedCheckpoint(list(history), commit_hash, self._file_id(checkpoint_file))
+                self._get_checkpoint_path(tag, ".json").unlink(missing_ok=True)
             logging.info(f"Chat session checkpoint saved to: {checkpoint_file}")
         except IOError as e:
+            # The file may now be out of step with what we recorded; rewrite it next time.
+            self._saved.pop(checkpoint_file, None)
             logging.error(f"Failed to save checkpoint: {e}")
 
+    @staticmethod
+    def _file_id(path: Path) -> Optional[tuple]:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return (stat.st_ino, stat.st_size)
+
+    def _rewrite_checkpoint(self, checkpoint_file: Path, history: List[Dict[str, Any]], commit_hash: Optional[str]):
+        self._temp_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = checkpoint_file.with_name(f"{checkpoint_file.name}.{os.getpid()}.tmp")
+        try:
+            # Written to a temp file first so an interrupted save never leaves a torn checkpoint.
+            tmp_path.write_bytes(self._encode_records(history, commit_hash))
+            os.replace(tmp_path, checkpoint_file)
+        except IOError:
+            tmp_path.unlink(missing_ok=True)
+            raise
+
+    @staticmethod
+    def _encode_records(messages: List[Dict[str, Any]], commit_hash: Optional[str]) -> bytes:
+        lines = [dumps_compact({"message": m}) for m in messages]
+        lines.append(dumps_compact({"commit_hash": commit_hash}))
+        return b"\n".join(lines) + b"\n"
+
     def load_checkpoint(self, tag: Optional[str] = None) -> CheckpointData | None:
         """Loads checkpoint data (history and hash) from a file if it exists."""
         checkpoint_file = self._get_checkpoint_path(tag)
-        if not checkpoint_file.exists():
-            return None
+        legacy_file = self._get_checkpoint_path(tag, ".json")
         try:
-            with open(checkpoint_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            if checkpoint_file.exists():
+                data = self._decode_records(checkpoint_file.read_bytes())
+            elif legacy_file.exists():
+                checkpoint_file = legacy_file
+                data = loads_json(legacy_file.read_bytes())
+            else:
+                return None
             logging.info(f"Resuming session from checkpoint: {checkpoint_file}")
             return data
         except (IOError, json.JSONDecodeError) as e:
             logging.error(f"Failed to load checkpoint: {e}")
             return None
-            
+
+    @staticmethod
+    def _decode_records(payload: bytes) -> CheckpointData:
+        history: List[Dict[str, Any]] = []
+        commit_hash = None
+        lines = payload.splitlines()
+        for i, line in enumerate(lines):
+            if not line:
+                continue
+            try:
+                record = loads_json(line)
+            except json.JSONDecodeError:
+                if i == len(lines) - 1:
+                    # A save interrupted mid-append; the earlier records are intact.
+                    logging.warning("Ignoring truncated final checkpoint record.")
+                    break
+                raise
+            if not isinstance(record, dict):
+                logging.warning(f"Ignoring malformed checkpoint record on line {i + 1}.")
+                continue
+            if "message" in record:
+                history.append(record["message"])
+            else:
+                commit_hash = record.get("commit_hash")
+        return {"history": history, "commit_hash": commit_hash}
+
     def list_checkpoints(self) -> List[str]:
         """Lists all available saved checkpoint tags."""
         if not self._temp_dir.exists():
             return []
-        checkpoints = []
-        for f in self._temp_dir.glob("checkpoint-*.json"):
-            tag = f.stem.replace("checkpoint-", "")
-            checkpoints.append(tag)
-        return sorted(checkpoints)
\ No newline at end of file
+        prefix = "checkpoint-"
+        checkpoints = set()
+        with os.scandir(self._temp_dir) as entries:
+            for entry in entries:
+                if not entry.name.startswith(prefix):
+                    continue
+                for suffix in (".jsonl", ".json"):
+                    if entry.name.endswith(suffix):
+                        checkpoints.add(entry.name[len(prefix):-len(suffix)])
+                        break
+        return sorted(checkpoints)
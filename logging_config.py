@@ -1,8 +1,8 @@
 #
 # File: logging_config.py
-# Revision: 2
-# Description: Corrects the INFO format to include the log level,
-# ensuring the detailed format is only used for DEBUG mode.
+# Revision: 4
+# Description: Outside DEBUG mode the caller lookup (a stack walk per log
+# record) is disabled, since only the DEBUG format prints the line number.
 #
 
 import logging
@@ -11,8 +11,17 @@ import logging
 DEBUG_FORMAT = '[%(asctime)s] [%(levelname)s] [%(name)s:%(lineno)d] %(message)s'
 INFO_FORMAT = '[%(levelname)s] %(message)s'  # <-- Corrected format
 
+_DEBUG_FORMATTER = logging.Formatter(DEBUG_FORMAT, datefmt='%Y-%m-%d %H:%M:%S')
+_INFO_FORMATTER = logging.Formatter(INFO_FORMAT)
+
+# logging walks the stack to find the caller only while _srcfile is set
+_SRCFILE = getattr(logging, '_srcfile', None)
+
+_NOISY_LOGGERS = ("google.auth.transport.requests", "urllib3.connectionpool", "httpx")
+
 # Store the current state
 is_debug_mode = False
+_handler: logging.StreamHandler | None = None
 
 def configure_logging(debug_mode: bool = False):
     """
@@ -22,28 +31,33 @@ def configure_logging(debug_mode: bool = False):
         debug_mode: If True, sets logging to DEBUG level with a detailed format.
                     Otherwise, sets to INFO level with a clean format.
     """
-    global is_debug_mode
+    global is_debug_mode, _handler
     is_debug_mode = debug_mode
     
     level = logging.DEBUG if debug_mode else logging.INFO
-    log_format = DEBUG_FORMAT if debug_mode else INFO_FORMAT
     
     root_logger = logging.getLogger()
     root_logger.setLevel(level)
     
-    # Remove existing handlers to avoid duplication
-    if root_logger.hasHandlers():
-        root_logger.handlers.clear()
-        
-    handler = logging.StreamHandler()
-    handler.setFormatter(logging.Formatter(log_format, datefmt='%Y-%m-%d %H:%M:%S'))
-    root_logger.addHandler(handler)
+    # Reuse our handler across toggles; drop any others to avoid duplication
+    if _handler is None:
+        _handler = logging.StreamHandler()
+    for existing in list(root_logger.handlers):
+        if existing is not _handler:
+            root_logger.removeHandler(existing)
+    if _handler not in root_logger.handlers:
+        root_logger.addHandler(_handler)
+    _handler.setFormatter(_DEBUG_FORMATTER if debug_mode else _INFO_FORMATTER)
+
+    # Neither format prints thread or process fields; only collect them when debugging
+    logging.logThreads = debug_mode
+    logging.logProcesses = debug_mode
+    logging.logMultiprocessing = debug_mode
+    logging._srcfile = _SRCFILE if debug_mode else None
     
     # Quieten down noisy libraries, but allow them to show in debug mode
-    if not debug_mode:
-        logging.getLogger("google.auth.transport.requests").setLevel(logging.WARNING)
-        logging.getLogger("urllib3.connectionpool").setLevel(logging.WARNING)
-        logging.getLogger("httpx").setLevel(logging.WARNING)
+    for name in _NOISY_LOGGERS:
+        logging.getLogger(name).setLevel(logging.NOTSET if debug_mode else logging.WARNING)
 
 def toggle_debug_mode():
     """Toggles the logging configuration between INFO and DEBUG mode."""
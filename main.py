@@ -1,10 +1,9 @@
 #
 # File: main.py
-# Revision: 34
-# Description: CRITICAL FIX. Adds backward compatibility for loading old
-# checkpoint files. The previous version would crash if it found a checkpoint
-# saved in the old list-based format. This version now checks the format
-# and handles both old ([...]) and new ({'history':...}) structures.
+# Revision: 54
+# Description: uvloop is passed to asyncio.Runner as the loop factory
+# instead of being installed as the global event loop policy, which uvloop
+# deprecates on Python 3.12+.
 #
 
 import argparse
@@ -15,6 +14,7 @@ from pathlib import Path
 from enum import Enum, auto
 import time
 import re
+import sys
 
 from prompt_toolkit import PromptSession
 from prompt_toolkit.history import FileHistory
@@ -30,6 +30,8 @@ from logging_config import configure_logging
 from at_command_processor import handle_at_command
 from slash_command_processor import SlashCommandProcessor
 
+PROMPT_HISTORY_PATH = USER_SETTINGS_DIR / "prompt_history.txt"
+
 class AppState(Enum):
     IDLE = auto()
     PROCESSING = auto()
@@ -41,34 +43,64 @@ ui_style = Style.from_dict({
     'prompt.gt': 'bg:#444444 #ffffff bold',
 })
 
-def prompt_for_confirmation(confirmation_details: dict) -> ToolConfirmationOutcome:
+_CONFIRM_RE = re.compile(r'\s*(y|yes|n|no|a|always)\s*$', re.IGNORECASE)
+_CONFIRM_OUTCOMES = {
+    'y': ToolConfirmationOutcome.PROCEED_ONCE, 'yes': ToolConfirmationOutcome.PROCEED_ONCE,
+    'n': ToolConfirmationOutcome.CANCEL, 'no': ToolConfirmationOutcome.CANCEL,
+    'a': ToolConfirmationOutcome.PROCEED_ALWAYS, 'always': ToolConfirmationOutcome.PROCEED_ALWAYS,
+}
+
+# Full confirmation prompts per details type, filled from the details dict.
+_CONFIRM_PROMPTS = {
+    "edit": "Apply this change to `{path}`?\n  (y)es, (n)o",
+    "memory_write": "Save the following fact to your global memory file (`{path}`)?\n  Fact: \"{fact}\"\n  (y)es, (n)o",
+    "exec": "Execute shell command: `{command}`?\n  (y)es, (n)o, (a)lways",
+    "write": "Write/overwrite file: `{path}`?\n  (y)es, (n)o",
+}
+_CONFIRM_DEFAULT_PROMPT = "Proceed with tool call: {details}?\n  (y)es, (n)o"
+
+async def prompt_for_confirmation(confirmation_details: dict, session: PromptSession) -> ToolConfirmationOutcome:
     details_type = confirmation_details.get("type")
-    prompt_str = ""
     if details_type == "edit":
         print("\n--- Proposed Change ---"); print(confirmation_details['diff']); print("---------------------\n")
-        prompt_str += f"Apply this change to `{confirmation_details['path']}`?\n"
-    elif details_type == "memory_write":
-        prompt_str += f"Save the following fact to your global memory file (`{confirmation_details['path']}`)?"
-        prompt_str += f"\n  Fact: \"{confirmation_details['fact']}\"\n"
-    elif details_type == "exec":
-        prompt_str += f"Execute shell command: `{confirmation_details['command']}`?\n"
-    elif details_type == "write":
-        prompt_str += f"Write/overwrite file: `{confirmation_details['path']}`?\n"
-    else:
-        prompt_str += f"Proceed with tool call: {confirmation_details}?\n"
-
-    if details_type == 'exec':
-        prompt_str += "  (y)es, (n)o, (a)lways"
-    else:
-        prompt_str += "  (y)es, (n)o"
+    template = _CONFIRM_PROMPTS.get(details_type, _CONFIRM_DEFAULT_PROMPT)
+    prompt_str = template.format_map({**confirmation_details, "details": confirmation_details})
 
     while True:
-        response = input(f"\n[CONFIRMATION] {prompt_str}\n> ").lower().strip()
-        if response in ['y', 'yes']: return ToolConfirmationOutcome.PROCEED_ONCE
-        if response in ['n', 'no']: return ToolConfirmationOutcome.CANCEL
-        if response in ['a', 'always'] and details_type == 'exec': return ToolConfirmationOutcome.PROCEED_ALWAYS
+        match = _CONFIRM_RE.match(await session.prompt_async(f"\n[CONFIRMATION] {prompt_str}\n> "))
+        outcome = _CONFIRM_OUTCOMES[match.group(1).lower()] if match else None
+        # "Always" is only offered for shell commands.
+        if outcome and (outcome != ToolConfirmationOutcome.PROCEED_ALWAYS or details_type == 'exec'):
+            return outcome
         print("Invalid input. Please enter a valid option.")
 
+class _BufferedStreamWriter:
+    """
+    Coalesces streamed text into one stdout write per frame (or per line),
+    instead of a write and flush for every token.
+    """
+    FLUSH_DELAY_S = 0.016
+
+    def __init__(self):
+        self._chunks: list[str] = []
+        self._flush_handle: asyncio.TimerHandle | None = None
+
+    def write(self, text: str):
+        self._chunks.append(text)
+        if '\n' in text:
+            self.flush()
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.FLUSH_DELAY_S, self.flush)
+
+    def flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if self._chunks:
+            sys.stdout.write(''.join(self._chunks))
+            self._chunks.clear()
+            sys.stdout.flush()
+
 class AgenticREPL:
     def __init__(self, config: Config, initial_model: str, reset_session: bool):
         self.config = config
@@ -83,10 +115,28 @@ class AgenticREPL:
         self.processing_task: asyncio.Task | None = None
         self.start_time = 0
         self.current_branch: str | None = None
+        self._toolbar_cache: tuple = (None, None)
+        # Separate from the main prompt so confirmations stay out of the input history.
+        self.confirmation_session: PromptSession = PromptSession()
+        # Holds at most the newest unsaved (history, commit_hash) snapshot.
+        self._checkpoint_queue: asyncio.Queue = asyncio.Queue(maxsize=1)
+        self._checkpoint_writer_task: asyncio.Task | None = None
+        self._stream_writer = _BufferedStreamWriter()
+        # Turn events other than 'content'; unknown types are ignored.
+        self._event_handlers = {
+            'confirmation_request': self._on_confirmation_request,
+            'tool_progress': self._on_tool_progress,
+            'error': self._on_error,
+        }
 
     def _get_toolbar_text(self):
-        elapsed = f"{(time.time() - self.start_time):.1f}s" if self.start_time else ""
         model_name = self.chat_session.model if self.chat_session else ""
+        # The elapsed time is shown to 0.1s, so redraws within the same tenth reuse the text.
+        tenths = int((time.time() - self.start_time) * 10) if self.start_time else 0
+        cache_key = (self.state, model_name, tenths)
+        if cache_key == self._toolbar_cache[0]:
+            return self._toolbar_cache[1]
+        elapsed = f"{tenths / 10:.1f}s" if self.start_time else ""
         
         if self.state == AppState.IDLE:
             text = f"[IDLE] Model: {model_name}"
@@ -97,7 +147,9 @@ class AgenticREPL:
         else:
             text = "[UNKNOWN STATE]"
             
-        return to_formatted_text(text, style='class:toolbar')
+        formatted = to_formatted_text(text, style='class:toolbar')
+        self._toolbar_cache = (cache_key, formatted)
+        return formatted
 
     def _get_prompt_message(self) -> FormattedText:
         if self.current_branch:
@@ -109,12 +161,15 @@ class AgenticREPL:
 
     async def _initialize(self):
         self.client = GeminiClient(self.config)
-        await self.client.initialize_user()
-        self.chat_session = ChatSession(self.client, self.config, self.initial_model)
-        self.current_branch = self.git_service.get_current_branch_name()
+        # Local setup does not need the project ID, so it overlaps with login and onboarding.
+        _, self.chat_session, self.current_branch, checkpoint_data = await asyncio.gather(
+            self.client.initialize_user(),
+            asyncio.to_thread(ChatSession, self.client, self.config, self.initial_model),
+            asyncio.to_thread(self.git_service.get_current_branch_name),
+            asyncio.to_thread(self.logger.load_checkpoint) if not self.reset_session else asyncio.sleep(0),
+        )
         
         if not self.reset_session:
-            checkpoint_data = self.logger.load_checkpoint()
             if checkpoint_data:
                 # FIX: Add backward compatibility for old list-based checkpoints
                 if isinstance(checkpoint_data, dict):
@@ -131,46 +186,111 @@ class AgenticREPL:
             print("--- Started new session (--reset flag used) ---")
 
     async def _run_turn(self, prompt):
+        """Runs a turn, then keeps continuing while the model says it should speak next."""
+        snapshot_before = True
+        while True:
+            next_speaker = await self._run_single_turn(prompt, snapshot_before)
+            if next_speaker != "model":
+                return
+            print(f"\n[AGENT] Continuing task (using model: {self.chat_session.model})...")
+            prompt = "Continue."
+            # The previous iteration's closing snapshot already covers the working tree.
+            snapshot_before = False
+
+    async def _run_single_turn(self, prompt, snapshot_before: bool = True):
         self.state = AppState.PROCESSING
         self.start_time = time.time()
+        next_speaker_task: asyncio.Task | None = None
+        snapshot_task: asyncio.Task | None = None
         try:
-            prompt_for_log = prompt[0]['text'][:50] if isinstance(prompt, list) and prompt else str(prompt)[:50]
-            snapshot_hash = self.git_service.create_file_snapshot(f"Snapshot before prompt: {prompt_for_log}...")
+            if snapshot_before:
+                prompt_for_log = prompt[0]['text'][:50] if isinstance(prompt, list) and prompt else str(prompt)[:50]
+                # Taken while the first model request is in flight; the session waits
+                # for it before running any tool, so it still precedes all file changes.
+                snapshot_task = asyncio.create_task(asyncio.to_thread(self.git_service.create_file_snapshot, f"Snapshot before prompt: {prompt_for_log}..."))
             
-            turn_generator = self.chat_session.send_message_stream(prompt)
+            turn_generator = self.chat_session.send_message_stream(prompt, before_tools=snapshot_task)
             async for event in turn_generator:
-                if event['type'] == 'content':
-                    print(event['value'], end='', flush=True)
-                elif event['type'] == 'confirmation_request':
-                    self.state = AppState.WAITING_FOR_CONFIRMATION
-                    print()
-                    outcome = await asyncio.to_thread(prompt_for_confirmation, event['value']['confirmation_details'])
-                    self.state = AppState.PROCESSING
-                    self.chat_session.provide_confirmation_response(event['value'], outcome)
-                elif event['type'] == 'error':
-                     print(f"\n[ERROR] An error occurred: {event['value']}")
-
-            next_speaker = await self.chat_session.check_next_speaker()
-            if next_speaker == "model":
-                print(f"\n[AGENT] Continuing task (using model: {self.chat_session.model})...")
-                await self._run_turn("Continue.")
+                event_type, value = event['type'], event['value']
+                # Content is by far the most frequent event, so it skips the table.
+                if event_type == 'content':
+                    self._stream_writer.write(value)
+                elif (handler := self._event_handlers.get(event_type)) is not None:
+                    self._stream_writer.flush()
+                    await handler(value)
 
+            # The check only reads the finished history, so it overlaps with the snapshot below.
+            next_speaker_task = asyncio.create_task(self.chat_session.check_next_speaker())
         finally:
+            self._stream_writer.flush()
             self.state = AppState.IDLE
             self.start_time = 0
-            final_hash = self.git_service.create_file_snapshot("Snapshot after turn completion.")
-            self.logger.save_checkpoint(self.chat_session.history, final_hash)
+            try:
+                if snapshot_task:
+                    # Two snapshots must never run git at the same time.
+                    await snapshot_task
+                final_hash = await asyncio.to_thread(self.git_service.create_file_snapshot, "Snapshot after turn completion.")
+            except BaseException:
+                if next_speaker_task:
+                    next_speaker_task.cancel()
+                raise
+            self._queue_checkpoint(self.chat_session.history, final_hash)
+
+        return await next_speaker_task
+
+    async def _on_confirmation_request(self, value):
+        self.state = AppState.WAITING_FOR_CONFIRMATION
+        print()
+        outcome = await prompt_for_confirmation(value['confirmation_details'], self.confirmation_session)
+        self.state = AppState.PROCESSING
+        self.chat_session.provide_confirmation_response(value, outcome)
+
+    async def _on_tool_progress(self, value):
+        print(f"\n[TOOL] {value['name']}: {value['status']}", flush=True)
+
+    async def _on_error(self, value):
+        print(f"\n[ERROR] An error occurred: {value}")
+
+    def _queue_checkpoint(self, history, commit_hash):
+        """Queues a checkpoint for the background writer, replacing any snapshot not yet written."""
+        # A shallow copy is enough: history messages are never mutated after creation.
+        snapshot = (list(history), commit_hash)
+        try:
+            self._checkpoint_queue.put_nowait(snapshot)
+        except asyncio.QueueFull:
+            self._checkpoint_queue.get_nowait()
+            self._checkpoint_queue.task_done()
+            self._checkpoint_queue.put_nowait(snapshot)
+
+    async def _checkpoint_writer(self):
+        while True:
+            history, commit_hash = await self._checkpoint_queue.get()
+            try:
+                await asyncio.to_thread(self.logger.save_checkpoint, history, commit_hash)
+            except Exception as e:
+                logging.error(f"Failed to save checkpoint: {e}")
+            finally:
+                self._checkpoint_queue.task_done()
+
+    async def flush_checkpoints(self):
+        """Waits for the pending checkpoint to be written and stops the writer."""
+        if self._checkpoint_writer_task is None:
+            return
+        await self._checkpoint_queue.join()
+        self._checkpoint_writer_task.cancel()
+        self._checkpoint_writer_task = None
 
     async def run(self):
         await self._initialize()
+        self._checkpoint_writer_task = asyncio.create_task(self._checkpoint_writer())
         command_processor = SlashCommandProcessor(self, self.chat_session)
         
-        history_path = USER_SETTINGS_DIR / "prompt_history.txt"
-        history_path.parent.mkdir(parents=True, exist_ok=True)
+        PROMPT_HISTORY_PATH.parent.mkdir(parents=True, exist_ok=True)
         session = PromptSession(
-            history=FileHistory(str(history_path)),
+            history=FileHistory(str(PROMPT_HISTORY_PATH)),
+            # The toolbar is only on screen while waiting for input, when nothing
+            # in it changes, so it is drawn per prompt rather than on a timer.
             bottom_toolbar=self._get_toolbar_text,
-            refresh_interval=0.5,
             style=ui_style,
             message=self._get_prompt_message
         )
@@ -201,6 +321,11 @@ class AgenticREPL:
                 break
 
 async def main():
+    # Python 3.12+: tasks start running synchronously in create_task, so short
+    # coroutines that finish without blocking skip a trip through the scheduler.
+    if hasattr(asyncio, "eager_task_factory"):
+        asyncio.get_running_loop().set_task_factory(asyncio.eager_task_factory)
+
     parser = argparse.ArgumentParser(description="A command-line interface for Google Gemini.")
     parser.add_argument("prompt", nargs='?', default=None, help="The initial prompt.")
     parser.add_argument("-m", "--model", choices=Models.all(), help="The model to use.")
@@ -227,12 +352,23 @@ async def main():
         logging.error(f"An unexpected error occurred: {e}")
         traceback.print_exc()
     finally:
+        if repl_app:
+            await repl_app.flush_checkpoints()
         if repl_app and repl_app.client:
             await repl_app.client.aclose()
         print("\nExiting application. Goodbye!")
 
+def get_event_loop_factory():
+    """Returns uvloop's loop factory if it is available (POSIX only), else None for the default loop."""
+    try:
+        import uvloop
+    except ImportError:
+        return None
+    return uvloop.new_event_loop
+
 if __name__ == '__main__':
     try:
-        asyncio.run(main())
+        with asyncio.Runner(loop_factory=get_event_loop_factory()) as runner:
+            runner.run(main())
     except (KeyboardInterrupt, EOFError):
         print("\nExiting.")
\ No newline at end of file
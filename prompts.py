@@ -1,9 +1,11 @@
 #
 # File: prompts.py
-# Revision: 3
-# Description: Corrects a NameError by using the correct GrepTool class name.
+# Revision: 4
+# Description: Caches the generated system prompt per target directory; it
+# only depends on the OS and the directory, which do not change at runtime.
 #
 
+import functools
 import platform
 from pathlib import Path
 from utils.git_utils import is_git_repository
@@ -14,6 +16,7 @@ from tools.find_tools import ListDirectoryTool, GlobTool, GrepTool
 from tools.edit_tool import ReplaceInFileTool
 from tools.memory_tool import MemoryTool
 
+@functools.lru_cache(maxsize=None)
 def get_core_system_prompt(target_dir: Path) -> str:
     """
     Generates the comprehensive system prompt with dynamic information and
@@ -1,10 +1,9 @@
 #
 # File: services/git_service.py
-# Revision: 3
-# Description: Implements the restore and branch-checking capabilities.
-# - Adds `restore_project_from_snapshot` to revert the working directory
-#   to a specific commit hash from the shadow repository.
-# - Adds `get_current_branch_name` to provide contextual information to the UI.
+# Revision: 5
+# Description: A shadow repo without a HEAD commit (e.g. the initial commit
+# failed) gets a root commit from the first snapshot instead of failing every
+# snapshot.
 #
 
 import logging
@@ -24,6 +23,8 @@ class GitService:
         self._is_git_repo = is_git_repository(self._project_root)
         self._history_dir = self._get_history_dir()
         self._git_env = self._get_git_env()
+        # (tree, commit) of the shadow repo's HEAD, once known.
+        self._last_snapshot: tuple[str, str] | None = None
 
     def _get_history_dir(self) -> Path:
         """Determines the location of the shadow git repo."""
@@ -56,7 +57,9 @@ class GitService:
             config_path = self._history_dir / ".git" / "config"
             with config_path.open("a") as f:
                 f.write("[user]\n\tname = Gemini CLI\n\temail = gemini-cli@google.com\n")
-            self._run_git_command("commit", "--allow-empty", "-m", "Initial commit")
+            result = self._run_git_command("commit", "--allow-empty", "-m", "Initial commit")
+            if result.returncode != 0:
+                logging.warning(f"Initial shadow commit failed; the first snapshot will create it: {result.stderr.strip()}")
         logging.info("Shadow Git repository is initialized.")
 
     def create_file_snapshot(self, message: str) -> str | None:
@@ -68,22 +71,33 @@ class GitService:
             
         try:
             logging.info("Creating file snapshot...")
-            self._run_git_command("add", "-A")
-            status_result = self._run_git_command("status", "--porcelain")
-            
-            if not status_result.stdout:
-                logging.info("No changes detected, no new snapshot created.")
-                return self._run_git_command("rev-parse", "HEAD", check=True).stdout.strip()
+            self._run_git_command("add", "-A", check=True)
+            tree = self._run_git_command("write-tree", check=True).stdout.strip()
+            if self._last_snapshot is None:
+                result = self._run_git_command("rev-parse", "HEAD", "HEAD^{tree}")
+                if result.returncode == 0:
+                    head, head_tree = result.stdout.split()
+                    self._last_snapshot = (head_tree, head)
 
-            commit_result = self._run_git_command("commit", "-m", message)
-            if commit_result.returncode != 0:
-                logging.warning(f"Snapshot commit did not succeed, but may not be an error. Stderr: {commit_result.stderr}")
-                return self._run_git_command("rev-parse", "HEAD", check=True).stdout.strip()
+            if self._last_snapshot is None:
+                # HEAD does not exist yet, so this snapshot becomes the root commit.
+                commit_hash = self._run_git_command("commit-tree", tree, "-m", message, check=True).stdout.strip()
+                self._run_git_command("update-ref", "HEAD", commit_hash, check=True)
+            else:
+                last_tree, last_commit = self._last_snapshot
+                if tree == last_tree:
+                    logging.info("No changes detected, no new snapshot created.")
+                    return last_commit
 
-            commit_hash = self._run_git_command("rev-parse", "HEAD", check=True).stdout.strip()
+                commit_hash = self._run_git_command("commit-tree", tree, "-p", last_commit, "-m", message, check=True).stdout.strip()
+                # Only moves HEAD if nobody else did since we read it.
+                self._run_git_command("update-ref", "HEAD", commit_hash, last_commit, check=True)
+            self._last_snapshot = (tree, commit_hash)
             logging.info(f"Created snapshot with hash: {commit_hash}")
             return commit_hash
         except subprocess.CalledProcessError as e:
+            # HEAD may have moved under us; look it up again next time.
+            self._last_snapshot = None
             logging.error(f"Failed to create file snapshot due to git command error: {e.stderr}")
             return None
         except Exception as e:
@@ -115,6 +129,7 @@ class GitService:
             return False
         try:
             logging.warning(f"Restoring project to snapshot {commit_hash}. This will discard current changes.")
+            self._last_snapshot = None
             # Reset the state of the files to the commit
             self._run_git_command("reset", "--hard", commit_hash, check=True)
             # Remove any new untracked files and directories
@@ -1,27 +1,32 @@
 #
 # File: services/memory_discovery.py
-# Revision: 1
-# Description: Service for discovering and loading hierarchical memory from
-# GEMINI.md files.
+# Revision: 2
+# Description: Splits file discovery out into `find_memory_files` and adds
+# `get_memory_signature`, so callers can tell whether memory has changed
+# without reading the files.
 #
 
 import logging
 from pathlib import Path
+from typing import List, Tuple
 
 from utils.git_utils import find_git_root
 
 MEMORY_FILE_NAME = "GEMINI.md"
 
-def load_memory(start_dir: Path) -> str:
+def _get_project_root(start_dir: Path) -> Path:
+    return find_git_root(start_dir) or start_dir.resolve()
+
+def find_memory_files(start_dir: Path) -> List[Path]:
     """
-    Finds and loads all GEMINI.md files in a hierarchical manner.
+    Finds all GEMINI.md files in a hierarchical manner, parents first.
 
     The search order is:
     1. Scan from start_dir up to the git root (or start_dir's root).
     2. Scan from that root directory downwards, finding all other memory files.
     """
     logging.info(f"Searching for memory files starting from: {start_dir}")
-    project_root = find_git_root(start_dir) or start_dir.resolve()
+    project_root = _get_project_root(start_dir)
     memory_files = []
 
     # 1. Scan upwards from start_dir to project_root
@@ -41,6 +46,26 @@ def load_memory(start_dir: Path) -> str:
 
     # Reverse the list so parent memories are loaded first
     memory_files.reverse()
+    return memory_files
+
+def get_memory_signature(memory_files: List[Path]) -> Tuple[Tuple[str, int], ...]:
+    """Returns a hashable (path, mtime) signature that changes whenever a memory file does."""
+    signature = []
+    for path in memory_files:
+        try:
+            signature.append((str(path), path.stat().st_mtime_ns))
+        except OSError:
+            signature.append((str(path), -1))
+    return tuple(signature)
+
+def load_memory(start_dir: Path, memory_files: List[Path] | None = None) -> str:
+    """
+    Loads the content of all GEMINI.md files found from `start_dir`.
+    Pass `memory_files` to reuse the result of a previous `find_memory_files` call.
+    """
+    project_root = _get_project_root(start_dir)
+    if memory_files is None:
+        memory_files = find_memory_files(start_dir)
 
     if not memory_files:
         logging.info("No memory files found.")
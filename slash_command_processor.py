@@ -1,14 +1,18 @@
 #
 # File: slash_command_processor.py
-# Revision: 2
-# Description: Implements the full suite of /chat and /restore commands.
-# This makes the snapshot and checkpointing system fully interactive,
-# allowing users to save, list, and restore session states and file states.
+# Revision: 3
+# Description: Implements the `/m <pro|flash>` command listed in /help, using
+# a precomputed shorthand table and model set for the lookup.
 #
 
 import logging
 from typing import TYPE_CHECKING, Callable, Dict, Awaitable
 
+from gemini_client import Models
+
+_MODEL_SHORTHANDS = {"pro": Models.DEFAULT, "flash": Models.FLASH}
+_ALL_MODELS = frozenset(Models.all())
+
 if TYPE_CHECKING:
     from chat_session import ChatSession
     from main import AgenticREPL
@@ -27,6 +31,7 @@ class SlashCommandProcessor:
             "/?": self._handle_help,
             "/chat": self._handle_chat,
             "/restore": self._handle_restore,
+            "/m": self._handle_model,
         }
         self.quit_commands = {"/quit", "quit", "exit"}
 
@@ -68,6 +73,17 @@ class SlashCommandProcessor:
         print(f"  History Length: {stats['history_length']} messages")
         print("---------------------\n")
 
+    async def _handle_model(self, user_input: str):
+        """Switches the model used by the current session."""
+        parts = user_input.strip().split()
+        arg = parts[1].lower() if len(parts) > 1 else ""
+        target = _MODEL_SHORTHANDS.get(arg) or (arg if arg in _ALL_MODELS else None)
+        if not target:
+            print(f"[ERROR] Usage: /m <{'|'.join(_MODEL_SHORTHANDS)}> (current model: {self.session.model})")
+            return
+        self.session.model = target
+        print(f"[SYSTEM] Model switched to {target}.")
+
     async def _handle_help(self, _):
         """Displays a help message with available commands."""
         help_text = """
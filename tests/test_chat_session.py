@@ -0,0 +1,202 @@
+#
+# File: tests/test_chat_session.py
+# Revision: 3
+# Description: Checks history compression, which runs in the background
+# between turns and backs off after the summariser fails, and tool progress
+# reporting for confirmed calls.
+#
+
+import asyncio
+import contextlib
+import json
+import unittest
+
+from chat_session import ChatSession, CHAT_WINDOW, COMPRESS_THRESHOLD, CONTEXT_ACK_MESSAGE
+from core_tool_scheduler import CoreToolScheduler
+from tools.tool_io import ToolConfirmationOutcome
+from utils.request_encoding import ContentsEncoder
+
+class _FakeClient:
+    project_id = "test-project"
+
+    def __init__(self, summary=None):
+        self.summary = summary
+        self.summary_requests = 0
+        # "stream" or "summary", in the order the requests were made.
+        self.requests = []
+
+    async def _make_api_request(self, endpoint, **kwargs):
+        self.summary_requests += 1
+        self.requests.append("summary")
+        if self.summary is None:
+            raise RuntimeError("summariser unavailable")
+        return {"response": {"candidates": [{"content": {"parts": [{"text": self.summary}]}}]}}
+
+    @contextlib.asynccontextmanager
+    async def stream_api_request(self, endpoint, **kwargs):
+        self.requests.append("stream")
+        yield _FakeStreamResponse([{"text": "ok"}])
+
+def _make_session(client, n_turns):
+    session = ChatSession.__new__(ChatSession)
+    session.client = client
+    session.model = "test-model"
+    session._contents_encoder = ContentsEncoder()
+    session._tools_payload = None
+    session._last_tool_response = None
+    session._compression_task = None
+    session._compress_failed_at = None
+    session.history = [{"role": "user", "parts": [{"text": "context"}]}, CONTEXT_ACK_MESSAGE]
+    _add_turns(session, n_turns)
+    return session
+
+class _FakeTool:
+    def __init__(self, needs_confirmation):
+        self.needs_confirmation = needs_confirmation
+
+    async def should_confirm_execute(self, **args):
+        return {"type": "edit", "path": "a.txt", "diff": ""} if self.needs_confirmation else None
+
+    async def execute(self, **args):
+        return {"ok": True}
+
+class _FakeRegistry:
+    def __init__(self):
+        self._tools = {"read_file": _FakeTool(False), "edit": _FakeTool(True)}
+
+    def get_tool(self, name):
+        return self._tools.get(name)
+
+class _FakeStreamResponse:
+    def __init__(self, parts):
+        self._parts = parts
+
+    async def aiter_bytes(self, chunk_size):
+        for part in self._parts:
+            payload = {"response": {"candidates": [{"content": {"parts": [part]}}]}}
+            yield b"data: " + json.dumps(payload).encode("utf-8") + b"\r\n\r\n"
+
+class _StreamingClient(_FakeClient):
+    """Answers the first request with tool calls and the next with text."""
+    def __init__(self, function_calls):
+        super().__init__()
+        self._replies = [[{"functionCall": fc} for fc in function_calls], [{"text": "done"}]]
+
+    @contextlib.asynccontextmanager
+    async def stream_api_request(self, endpoint, **kwargs):
+        yield _FakeStreamResponse(self._replies.pop(0))
+
+def _add_turns(session, n_turns):
+    for i in range(n_turns):
+        session.history += [
+            {"role": "user", "parts": [{"text": f"prompt {i}"}]},
+            {"role": "model", "parts": [{"functionCall": {"name": "read_file", "args": {}}}]},
+            {"role": "user", "parts": [{"functionResponse": {"name": "read_file", "response": {}}}]},
+        ]
+
+async def _run_turn(session):
+    return [event async for event in session.send_message_stream("next")]
+
+async def _finish_compression(session):
+    if session._compression_task is not None:
+        await asyncio.wait({session._compression_task})
+
+class CompressOldHistoryTest(unittest.TestCase):
+    def test_keeps_context_and_starts_window_at_user_prompt(self):
+        session = _make_session(_FakeClient(summary="the summary"), 80)
+        tail = session.history[-CHAT_WINDOW:]
+        self.assertTrue(asyncio.run(session.compress_old_history()))
+        self.assertEqual(session.history[1], CONTEXT_ACK_MESSAGE)
+        self.assertIn("the summary", session.history[2]["parts"][0]["text"])
+        kept = session.history[4:]
+        self.assertEqual(kept[0]["parts"][0]["text"], "prompt 64")
+        self.assertLessEqual(len(kept), CHAT_WINDOW)
+        self.assertTrue(all(a is b for a, b in zip(kept, tail[-len(kept):])))
+
+class BackgroundCompressionTest(unittest.IsolatedAsyncioTestCase):
+    async def test_turn_does_not_wait_for_summary(self):
+        client = _FakeClient(summary="the summary")
+        session = _make_session(client, COMPRESS_THRESHOLD // 3 + 1)
+        original_length = len(session.history)
+
+        await _run_turn(session)
+        self.assertEqual(client.requests, ["stream"])
+        self.assertEqual(len(session.history), original_length + 2)
+        previous_turn = session.history[-2:]
+
+        await _finish_compression(session)
+        self.assertEqual(client.requests, ["stream", "summary"])
+
+        await _run_turn(session)
+        self.assertIn("the summary", session.history[2]["parts"][0]["text"])
+        self.assertLessEqual(len(session.history), CHAT_WINDOW + 6)
+        self.assertTrue(all(a is b for a, b in zip(session.history[-4:-2], previous_turn)))
+        self.assertEqual(session.history[-1], {"role": "model", "parts": [{"text": "ok"}]})
+
+    async def test_failed_summary_is_not_retried_every_turn(self):
+        client = _FakeClient(summary=None)
+        session = _make_session(client, COMPRESS_THRESHOLD // 3 + 1)
+
+        await _run_turn(session)
+        await _finish_compression(session)
+        self.assertEqual(client.summary_requests, 1)
+
+        await _run_turn(session)
+        await _run_turn(session)
+        await _finish_compression(session)
+        self.assertEqual(client.summary_requests, 1)
+
+        _add_turns(session, CHAT_WINDOW // 3 + 1)
+        await _run_turn(session)
+        await _finish_compression(session)
+        self.assertEqual(client.summary_requests, 2)
+
+    async def test_success_after_failure_compresses(self):
+        client = _FakeClient(summary=None)
+        session = _make_session(client, COMPRESS_THRESHOLD // 3 + 1)
+        await _run_turn(session)
+        await _finish_compression(session)
+        client.summary = "recovered"
+        _add_turns(session, CHAT_WINDOW // 3 + 1)
+        await _run_turn(session)
+        await _finish_compression(session)
+        await _run_turn(session)
+        self.assertLessEqual(len(session.history), CHAT_WINDOW + 6)
+        self.assertIsNone(session._compress_failed_at)
+
+    async def test_summary_of_replaced_history_is_discarded(self):
+        client = _FakeClient(summary="stale")
+        session = _make_session(client, COMPRESS_THRESHOLD // 3 + 1)
+        await _run_turn(session)
+        session.history = session.history[:2] + [{"role": "user", "parts": [{"text": "resumed"}]}]
+        await _finish_compression(session)
+        await _run_turn(session)
+        self.assertEqual(len(session.history), 5)
+
+class ToolProgressTest(unittest.TestCase):
+    def test_confirmed_call_reports_progress(self):
+        client = _StreamingClient([{"name": "read_file", "args": {}}, {"name": "edit", "args": {}}])
+        session = _make_session(client, 0)
+        session._scheduler = CoreToolScheduler(_FakeRegistry())
+        session._pending_confirmation = None
+        session._confirmation_received_event = asyncio.Event()
+        session._confirmation_outcome = None
+
+        async def run():
+            events = []
+            async for event in session.send_message_stream("go"):
+                events.append(event)
+                if event["type"] == "confirmation_request":
+                    session.provide_confirmation_response(event["value"], ToolConfirmationOutcome.PROCEED_ONCE)
+            return events
+
+        events = asyncio.run(run())
+        progress = [e["value"] for e in events if e["type"] == "tool_progress"]
+        self.assertEqual(progress, [{"name": "read_file", "status": "success"}, {"name": "edit", "status": "success"}])
+        confirmation_index = next(i for i, e in enumerate(events) if e["type"] == "confirmation_request")
+        last_progress_index = max(i for i, e in enumerate(events) if e["type"] == "tool_progress")
+        self.assertLess(confirmation_index, last_progress_index)
+        self.assertEqual(session.history[-1], {"role": "model", "parts": [{"text": "done"}]})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+#
+# File: tests/test_gemini_client.py
+# Revision: 2
+# Description: Checks the refresh_token grant used to renew access tokens,
+# which returns new credentials rather than mutating the old ones.
+#
+
+import asyncio
+import json
+import unittest
+
+from google.oauth2.credentials import Credentials
+
+from gemini_client import GeminiClient
+
+class _FakeRequest:
+    def __init__(self, method, url, data=None, headers=None):
+        self.method, self.url, self.data = method, url, data
+        self.headers = dict(headers or {})
+        self.headers['Authorization'] = 'Bearer expired'
+
+class _FakeResponse:
+    def __init__(self, status_code, payload):
+        self.status_code = status_code
+        self.content = json.dumps(payload).encode('utf-8')
+        self.text = self.content.decode('utf-8')
+
+    @property
+    def is_error(self):
+        return self.status_code >= 400
+
+class _FakeHttpClient:
+    def __init__(self, payload, status_code=200):
+        self.response = _FakeResponse(status_code, payload)
+        self.sent = []
+
+    def build_request(self, method, url, **kwargs):
+        return _FakeRequest(method, url, **kwargs)
+
+    async def send(self, request, **kwargs):
+        self.sent.append(request)
+        return self.response
+
+def _make_client(payload):
+    client = GeminiClient.__new__(GeminiClient)
+    client.http_client = _FakeHttpClient(payload)
+    return client
+
+def _make_credentials():
+    return Credentials(token='old-access', refresh_token='old-refresh', client_id='id',
+                       client_secret='secret', token_uri='https://oauth2.example/token',
+                       scopes=['https://www.googleapis.com/auth/cloud-platform'])
+
+class RefreshAccessTokenTest(unittest.TestCase):
+    def test_keeps_refresh_token_when_not_rotated(self):
+        client = _make_client({'access_token': 'new-access', 'expires_in': 3600})
+        old = _make_credentials()
+        creds = asyncio.run(client._refresh_access_token(old))
+        self.assertEqual(creds.token, 'new-access')
+        self.assertEqual(creds.refresh_token, 'old-refresh')
+        self.assertEqual(creds.scopes, old.scopes)
+        self.assertIsNotNone(creds.expiry)
+        self.assertEqual(old.token, 'old-access')
+        request = client.http_client.sent[0]
+        self.assertNotIn('Authorization', request.headers)
+        self.assertEqual(request.data['grant_type'], 'refresh_token')
+
+    def test_stores_rotated_refresh_token(self):
+        client = _make_client({'access_token': 'new-access', 'expires_in': 3600, 'refresh_token': 'new-refresh'})
+        creds = asyncio.run(client._refresh_access_token(_make_credentials()))
+        self.assertEqual(creds.refresh_token, 'new-refresh')
+        self.assertEqual(json.loads(creds.to_json())['refresh_token'], 'new-refresh')
+
+if __name__ == '__main__':
+    unittest.main()
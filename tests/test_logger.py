@@ -0,0 +1,54 @@
+#
+# File: tests/test_logger.py
+# Revision: 2
+# Description: Checks that appended checkpoints never build on a file that
+# was deleted or replaced behind the logger's back, and that loading skips
+# records that are not JSON objects.
+#
+
+import tempfile
+import unittest
+from pathlib import Path
+
+from logger import Logger
+
+def _message(i):
+    return {"role": "user", "parts": [{"text": f"message {i}"}]}
+
+class CheckpointAppendTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.logger = Logger(Path(self._tmp.name))
+        self.logger._temp_dir = Path(self._tmp.name)
+        self.history = [_message(0), _message(1)]
+        self.logger.save_checkpoint(self.history, "abc")
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_append_round_trip(self):
+        self.history.append(_message(2))
+        self.logger.save_checkpoint(self.history, "def")
+        self.assertEqual(self.logger.load_checkpoint(), {"history": self.history, "commit_hash": "def"})
+
+    def test_deleted_file_is_rewritten(self):
+        self.logger._get_checkpoint_path().unlink()
+        self.history.append(_message(2))
+        self.logger.save_checkpoint(self.history, "def")
+        self.assertEqual(self.logger.load_checkpoint()["history"], self.history)
+
+    def test_replaced_file_is_rewritten(self):
+        other = Logger(Path(self._tmp.name))
+        other._temp_dir = Path(self._tmp.name)
+        other.save_checkpoint([_message(9)], "zzz")
+        self.history.append(_message(2))
+        self.logger.save_checkpoint(self.history, "def")
+        self.assertEqual(self.logger.load_checkpoint(), {"history": self.history, "commit_hash": "def"})
+
+    def test_non_object_records_are_skipped(self):
+        with open(self.logger._get_checkpoint_path(), 'ab') as f:
+            f.write(b'null\n[1, 2]\n"text"\n')
+        self.assertEqual(self.logger.load_checkpoint(), {"history": self.history, "commit_hash": "abc"})
+
+if __name__ == '__main__':
+    unittest.main()
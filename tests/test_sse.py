@@ -0,0 +1,61 @@
+#
+# File: tests/test_sse.py
+# Revision: 2
+# Description: Checks that SSE framing does not depend on where the network
+# splits the stream into chunks, including on the memoryview fast path.
+#
+
+import asyncio
+import unittest
+
+from utils.sse import iter_sse_data
+
+def _collect(chunks):
+    async def gen():
+        for chunk in chunks:
+            yield chunk
+    async def run():
+        return [bytes(data) async for data in iter_sse_data(gen())]
+    return asyncio.run(run())
+
+class IterSseDataTest(unittest.TestCase):
+    CRLF_STREAM = b'data: {"a":1}\r\n\r\ndata: {"a":2}\r\n\r\n: keep-alive\r\n\r\ndata: {"a":3}\r\n\r\n'
+    LF_STREAM = b'data: {"a":1}\n\ndata:{"a":2}\nid: 7\n\ndata: {"a":3}'
+    EXPECTED = [b'{"a":1}', b'{"a":2}', b'{"a":3}']
+
+    def test_whole_stream(self):
+        self.assertEqual(_collect([self.CRLF_STREAM]), self.EXPECTED)
+        self.assertEqual(_collect([self.LF_STREAM]), self.EXPECTED)
+
+    def test_split_at_every_offset(self):
+        for stream in (self.CRLF_STREAM, self.LF_STREAM):
+            for i in range(len(stream) + 1):
+                with self.subTest(stream=stream, offset=i):
+                    self.assertEqual(_collect([stream[:i], stream[i:]]), self.EXPECTED)
+
+    def test_one_byte_chunks(self):
+        for stream in (self.CRLF_STREAM, self.LF_STREAM):
+            chunks = [stream[i:i + 1] for i in range(len(stream))]
+            self.assertEqual(_collect(chunks), self.EXPECTED)
+
+    def test_fast_path_memoryview_with_split_crlf(self):
+        stream = b'data: {"a":1}\r\n\r\ndata: {"a":2}\r\n\r\n'
+        for i in range(len(stream) + 1):
+            with self.subTest(offset=i):
+                async def gen():
+                    yield stream[:i]
+                    yield stream[i:]
+                async def run():
+                    return [data async for data in iter_sse_data(gen())]
+                payloads = asyncio.run(run())
+                self.assertTrue(all(isinstance(data, memoryview) for data in payloads))
+                self.assertEqual([bytes(data) for data in payloads], [b'{"a":1}', b'{"a":2}'])
+
+    def test_multiline_data_joined(self):
+        stream = b'data: {"a":\r\ndata: 1}\r\n\r\n'
+        for i in range(len(stream) + 1):
+            with self.subTest(offset=i):
+                self.assertEqual(_collect([stream[:i], stream[i:]]), [b'{"a":\n1}'])
+
+if __name__ == '__main__':
+    unittest.main()
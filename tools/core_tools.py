@@ -1,11 +1,9 @@
 #
 # File: tools/core_tools.py
-# Revision: 7
-# Description: 
-# The ShellTool is significantly enhanced to be more robust and secure.
-# - Uses `create_subprocess_exec` instead of `shell=True` for better security.
-# - Streams stdout/stderr to detect binary content and prevent terminal corruption.
-# - Returns a detailed dictionary of the execution result.
+# Revision: 8
+# Description: ReadFileTool does its path checks and file read in a worker
+# thread, so concurrent reads (parallel tool calls, several @-paths) no
+# longer block the event loop or each other.
 #
 
 import asyncio
@@ -152,6 +150,8 @@ class ReadFileTool(Tool):
         return None # Reading a file is considered safe.
     async def execute(self, path: str) -> dict:
         logging.info(f"Reading file: {path}")
+        return await asyncio.to_thread(self._read, path)
+    def _read(self, path: str) -> dict:
         try:
             file_path = self._root_dir / path
             if not file_path.resolve().is_relative_to(self._root_dir.resolve()):
@@ -0,0 +1,55 @@
+#
+# File: utils/history_compressor.py
+# Revision: 1
+# Description: Asks the model to summarise the older part of a conversation so
+# that long sessions can replace it with a single summary message.
+#
+
+import logging
+from typing import Any, Dict, List, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from chat_session import ChatSession
+
+COMPRESSION_PROMPT = """
+Summarize the conversation so far so that it can replace the full history.
+
+Include:
+1. The user's overall goal and any explicit instructions or preferences.
+2. Files that were read, created or modified, and the important facts learned about them.
+3. Decisions made, work completed, and anything still outstanding.
+
+Be concise but do not omit details needed to continue the task. Respond with the summary only.
+"""
+
+async def summarize_history(session: 'ChatSession', messages: List[Dict[str, Any]]) -> str | None:
+    """Calls the Gemini API to summarise `messages`. Returns None if no summary could be produced."""
+    logging.debug(f"Summarizing {len(messages)} history messages...")
+
+    try:
+        request_components = {
+            "project": session.client.project_id,
+            "request": {
+                'contents': messages + [{"role": "user", "parts": [{"text": COMPRESSION_PROMPT}]}]
+            }
+        }
+
+        response_json = await session.client._make_api_request(
+            'generateContent',
+            request_components=request_components,
+            stream=False,
+            chat_session=session
+        )
+
+        # Code Assist wraps the Gemini response in a 'response' field.
+        response = response_json.get('response', response_json)
+        parts = response.get('candidates', [{}])[0].get('content', {}).get('parts', [])
+        summary = "".join(p.get('text', '') for p in parts).strip()
+        if not summary:
+            logging.warning("History summarization returned no text.")
+            return None
+        return summary
+
+    except Exception as e:
+        logging.error(f"Error summarizing history: {e}. Keeping full history.")
+        return None
@@ -0,0 +1,67 @@
+#
+# File: utils/request_encoding.py
+# Revision: 4
+# Description: `loads_json` also accepts memoryviews, which orjson parses in
+# place.
+#
+
+import json
+from typing import Any, Dict, List
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def dumps_compact(obj: Any) -> bytes:
+    """Serialises an object to compact UTF-8 JSON bytes."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+def loads_json(data: bytes | memoryview) -> Any:
+    """Parses JSON from bytes. Raises json.JSONDecodeError on invalid input."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(bytes(data) if isinstance(data, memoryview) else data)
+
+class ContentsEncoder:
+    """
+    Caches the encoded form of each message in a `contents` list.
+
+    Messages are matched by identity, so the cached prefix is reused as long
+    as the caller keeps appending to (or copying) the same history. Messages
+    must not be mutated after they have been encoded.
+    """
+    def __init__(self):
+        self._messages: List[Dict[str, Any]] = []
+        self._encoded: List[bytes] = []
+
+    def encode(self, contents: List[Dict[str, Any]]) -> bytes:
+        """Returns the JSON array for `contents`, encoding only new messages."""
+        common = 0
+        limit = min(len(contents), len(self._messages))
+        while common < limit and contents[common] is self._messages[common]:
+            common += 1
+        del self._messages[common:]
+        del self._encoded[common:]
+        for message in contents[common:]:
+            self._messages.append(message)
+            self._encoded.append(dumps_compact(message))
+        return b'[' + b','.join(self._encoded) + b']'
+
+    def clear(self):
+        self._messages.clear()
+        self._encoded.clear()
+
+def build_request_body(components: Dict[str, Any], encoded_contents: bytes) -> bytes:
+    """
+    Serialises a Code Assist request, splicing the pre-encoded `contents`
+    array into the `request` object.
+    """
+    outer = {k: v for k, v in components.items() if k != 'request'}
+    inner = {k: v for k, v in components.get('request', {}).items() if k != 'contents'}
+    inner_json = dumps_compact(inner)
+    request_json = b'{"contents":' + encoded_contents + (b',' + inner_json[1:] if inner else b'}')
+    outer_json = dumps_compact(outer)
+    return outer_json[:-1] + (b',' if outer else b'') + b'"request":' + request_json + b'}'
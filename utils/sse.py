@@ -0,0 +1,55 @@
+#
+# File: utils/sse.py
+# Revision: 3
+# Description: A `\r` at the end of a network chunk is held back until the
+# next chunk arrives, so a CRLF split across two reads is still normalised
+# and event separators are never missed.
+#
+
+from typing import AsyncIterator
+
+SSE_READ_CHUNK_SIZE = 64 * 1024
+
+def _extract_data(event: bytearray) -> memoryview | bytes | None:
+    """Joins the `data:` fields of a single event. Returns None for comments and empty events."""
+    if event.startswith(b'data:') and b'\n' not in event:
+        # Fast path: one data line, returned as a zero-copy view.
+        start = 6 if event.startswith(b'data: ') else 5
+        end = len(event) - 1 if event.endswith(b'\r') else len(event)
+        return memoryview(event)[start:end]
+    data_lines = []
+    for line in event.split(b'\n'):
+        if line.endswith(b'\r'):
+            line = line[:-1]
+        if not line.startswith(b'data:'):
+            # Keep-alive comments (':'), 'event:', 'id:' and 'retry:' fields are ignored.
+            continue
+        value = line[5:]
+        data_lines.append(value[1:] if value.startswith(b' ') else value)
+    return b'\n'.join(data_lines) if data_lines else None
+
+async def iter_sse_data(chunks: AsyncIterator[bytes]) -> AsyncIterator[memoryview | bytes]:
+    """
+    Yields the data payload of each event in an SSE byte stream. Payloads
+    may be memoryviews; pass them straight to `loads_json`.
+    """
+    buf = bytearray()
+    # True when the previous chunk ended in a `\r` that may start a CRLF.
+    pending_cr = False
+    async for chunk in chunks:
+        if pending_cr:
+            chunk = b'\r' + chunk
+        pending_cr = chunk.endswith(b'\r')
+        if pending_cr:
+            chunk = chunk[:-1]
+        buf += chunk.replace(b'\r\n', b'\n')
+        while (end := buf.find(b'\n\n')) != -1:
+            event = buf[:end]
+            del buf[:end + 2]
+            if (data := _extract_data(event)) is not None:
+                yield data
+    if pending_cr:
+        buf += b'\r'
+    # Flush a trailing event that was not followed by a blank line.
+    if buf.strip() and (data := _extract_data(buf)) is not None:
+        yield data